@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_panel', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['-timestamp', '-id'], name='log_timestamp_keyset'),
+        ),
+    ]
@@ -20,5 +20,8 @@ class Log(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['-timestamp', '-id'], name='log_timestamp_keyset')]
+
     def __str__(self):
         return f"{self.timestamp} - {self.log_type} - {self.severity}"
\ No newline at end of file
@@ -1,10 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.paginator import Paginator
 from django.db.models import Q
 from django.contrib import messages
 from authentication.models import User
 from documents.models import Document
+from documents.pagination import KeysetPaginator
+from documents.search.cache import result_cache
 from .models import Log
 from .forms import LogFilterForm, UserForm
 from django.utils import timezone
@@ -67,6 +68,7 @@ def admin_dashboard(request):
         'recent_searches': recent_searches,
         'security_events': security_events,
         'recent_logs': recent_logs,
+        'result_cache': result_cache.stats(),
     })
 
 @login_required
@@ -87,7 +89,7 @@ def user_management(request):
 @admin_required
 def system_logs(request):
     form = LogFilterForm(request.GET or None)
-    logs = Log.objects.all().order_by('-timestamp')
+    logs = Log.objects.select_related('user')
     if form.is_valid():
         if form.cleaned_data['log_type']:
             logs = logs.filter(log_type=form.cleaned_data['log_type'])
@@ -99,9 +101,11 @@ def system_logs(request):
             logs = logs.filter(timestamp__gte=form.cleaned_data['date_from'])
         if form.cleaned_data['date_to']:
             logs = logs.filter(timestamp__lte=form.cleaned_data['date_to'])
-    paginator = Paginator(logs, 10)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.page(page_number)
+    # Cursor pagination: deep pages of a large log table cost the same as the
+    # first, and the total is an estimate counted at most every COUNT_TIMEOUT
+    page_obj = KeysetPaginator(
+        logs, 10, ordering=('-timestamp', '-id'), approximate=True,
+    ).page(request.GET.get('page'))
     return render(request, 'admin_panel/system_logs.html', {'form': form, 'page_obj': page_obj})
 
 @login_required
@@ -0,0 +1,68 @@
+import json
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from documents.compression import compressor, decompressor, zstandard
+
+from .models import ChatArchive, ChatMessage
+
+# Messages older than a cutoff are moved out of the live chat table into
+# ChatArchive rows, each a compressed JSON list of up to BATCH_SIZE messages
+# of one conversation. The live table then only holds recent history, which
+# is all the chat page reads.
+BATCH_SIZE = 1000
+CODEC = 'zstd' if zstandard is not None else 'zlib'
+
+
+def write_batch(messages, codec=CODEC):
+    payload = [
+        {
+            'id': message.pk,
+            'content': message.content,
+            'is_user': message.is_user,
+            'timestamp': message.timestamp.isoformat(),
+            'documents': [document.pk for document in message.documents.all()],
+        }
+        for message in messages
+    ]
+    return compressor(codec)(json.dumps(payload, separators=(',', ':')).encode())
+
+
+def read_batch(codec, data):
+    messages = json.loads(decompressor(codec)(bytes(data)))
+    for message in messages:
+        message['timestamp'] = parse_datetime(message['timestamp'])
+    return messages
+
+
+def archive_messages(before, batch_size=BATCH_SIZE):
+    """
+    Move messages older than ``before`` into ChatArchive, one transaction
+    per batch. Returns (messages archived, batches written).
+    """
+    old = ChatMessage.objects.filter(timestamp__lt=before)
+    threads = list(old.values_list('user_id', 'conversation_id').distinct())
+    archived = batches = 0
+    for user_id, conversation_id in threads:
+        while True:
+            with transaction.atomic():
+                messages = list(
+                    old.filter(user_id=user_id, conversation_id=conversation_id)
+                    .order_by('timestamp', 'id').prefetch_related('documents')[:batch_size]
+                )
+                if not messages:
+                    break
+                ChatArchive.objects.create(
+                    user_id=user_id,
+                    conversation_id=conversation_id,
+                    first_timestamp=messages[0].timestamp,
+                    last_timestamp=messages[-1].timestamp,
+                    message_count=len(messages),
+                    codec=CODEC,
+                    data=write_batch(messages),
+                )
+                ChatMessage.objects.filter(pk__in=[message.pk for message in messages]).delete()
+            archived += len(messages)
+            batches += 1
+    return archived, batches
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import re
+import shutil
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Ways to run the chat classifier on CPU, chosen with CHAT_INFERENCE['BACKEND']:
+#   torch  the model in fp32
+#   int8   the same model with its Linear layers dynamically quantized to int8
+#   onnx   the model exported to ONNX and run by onnxruntime
+# Every backend is built from one reference checkpoint, the fp32 model saved
+# under CHAT_INFERENCE['ARTIFACT_DIR'] on first use. A model without a
+# trained classification head gets a random one each time it is loaded, so
+# without the saved copy the backends (and chat_backend_report) would
+# compare unrelated classifiers. Converted models are cached next to it by
+# manage.py convert_chat_model. All imports of torch, transformers and
+# onnxruntime happen inside the loaders, i.e. in the inference server only.
+BACKENDS = ('torch', 'int8', 'onnx')
+REFERENCE = 'fp32'  # Artifact directory of the reference checkpoint
+
+
+def artifact_dir(options, backend):
+    slug = re.sub(r'[^\w.-]+', '--', options['MODEL'])
+    return os.path.join(options['ARTIFACT_DIR'], slug, backend)
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class Classifier:
+    """
+    Callable with the part of the text-classification pipeline interface the
+    inference server uses: ``classifier(texts, truncation=True, batch_size=n)``
+    returns one {'label', 'score'} per text.
+    """
+
+    def __init__(self, tokenizer, id2label, max_length=512):
+        self.tokenizer = tokenizer
+        self.id2label = {int(key): value for key, value in id2label.items()}
+        self.max_length = max_length
+
+    def logits(self, encoded):
+        raise NotImplementedError
+
+    def __call__(self, texts, truncation=True, batch_size=None):
+        batch_size = batch_size or len(texts)
+        results = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=truncation,
+                max_length=self.max_length, return_tensors='np',
+            )
+            probabilities = _softmax(self.logits(encoded))
+            for row in probabilities:
+                best = int(row.argmax())
+                results.append({'label': self.id2label[best], 'score': float(row[best])})
+        return results
+
+
+class TorchClassifier(Classifier):
+    def __init__(self, model, tokenizer):
+        super().__init__(tokenizer, model.config.id2label)
+        self.model = model.eval()
+
+    def logits(self, encoded):
+        import torch
+
+        with torch.inference_mode():
+            inputs = {name: torch.from_numpy(value) for name, value in encoded.items()}
+            return self.model(**inputs).logits.float().numpy()
+
+
+class OnnxClassifier(Classifier):
+    def __init__(self, session, tokenizer, id2label):
+        super().__init__(tokenizer, id2label)
+        self.session = session
+        self.input_names = {item.name for item in session.get_inputs()}
+
+    def logits(self, encoded):
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        return self.session.run(['logits'], inputs)[0]
+
+
+def save_reference(options):
+    """
+    Save the fp32 model and tokenizer as downloaded, once; returns the
+    directory every backend is built from.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    directory = artifact_dir(options, REFERENCE)
+    if os.path.exists(os.path.join(directory, 'config.json')):
+        return directory
+    tokenizer = AutoTokenizer.from_pretrained(options['MODEL'], cache_dir=options['CACHE_DIR'])
+    model, info = AutoModelForSequenceClassification.from_pretrained(
+        options['MODEL'], cache_dir=options['CACHE_DIR'], output_loading_info=True,
+    )
+    if info['missing_keys']:
+        logger.warning(
+            "%s has no trained classification head (newly initialized: %s); its labels are "
+            "meaningless. Set CHAT_INFERENCE['MODEL'] to a fine-tuned checkpoint.",
+            options['MODEL'], ', '.join(info['missing_keys']),
+        )
+    temporary = f'{directory}.{os.getpid()}.tmp'
+    tokenizer.save_pretrained(temporary)
+    model.save_pretrained(temporary)
+    try:
+        os.rename(temporary, directory)
+    except OSError:
+        # Another process saved it first
+        if not os.path.exists(os.path.join(directory, 'config.json')):
+            raise
+        shutil.rmtree(temporary, ignore_errors=True)
+    return directory
+
+
+def _load_fp32(options):
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    directory = save_reference(options)
+    tokenizer = AutoTokenizer.from_pretrained(directory)
+    model = AutoModelForSequenceClassification.from_pretrained(directory)
+    return model.eval(), tokenizer
+
+
+def _quantize(model):
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_torch(options):
+    model, tokenizer = _load_fp32(options)
+    return TorchClassifier(model, tokenizer)
+
+
+def load_int8(options):
+    """Quantized weights from the artifact directory, or quantized at load."""
+    import torch
+
+    directory = artifact_dir(options, 'int8')
+    weights = os.path.join(directory, 'quantized.pt')
+    if not os.path.exists(weights):
+        model, tokenizer = _load_fp32(options)
+        return TorchClassifier(_quantize(model), tokenizer)
+    # The module structure comes from the saved config; the weights were
+    # quantized by convert_chat_model
+    from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+    model = AutoModelForSequenceClassification.from_config(AutoConfig.from_pretrained(directory))
+    model = _quantize(model.eval())
+    model.load_state_dict(torch.load(weights, weights_only=True))
+    return TorchClassifier(model, AutoTokenizer.from_pretrained(directory))
+
+
+def load_onnx(options):
+    import onnxruntime
+    from transformers import AutoTokenizer
+
+    directory = artifact_dir(options, 'onnx')
+    path = os.path.join(directory, 'model.onnx')
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} is missing; run manage.py convert_chat_model --backend onnx")
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if options.get('THREADS'):
+        session_options.intra_op_num_threads = options['THREADS']
+    session = onnxruntime.InferenceSession(path, session_options, providers=['CPUExecutionProvider'])
+    with open(os.path.join(directory, 'labels.json')) as f:
+        id2label = json.load(f)
+    return OnnxClassifier(session, AutoTokenizer.from_pretrained(directory), id2label)
+
+
+LOADERS = {
+    'torch': load_torch,
+    'int8': load_int8,
+    'onnx': load_onnx,
+}
+
+
+def load_classifier(options, backend=None):
+    backend = backend or options['BACKEND']
+    if backend not in LOADERS:
+        raise ValueError(f"Unknown inference backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    return LOADERS[backend](options)
+
+
+def load_configured_classifier():
+    """Model registry loader for the classifier in CHAT_INFERENCE."""
+    from .inference import config
+
+    return load_classifier(config())
+
+
+def load_qa_pipeline():
+    """Model registry loader for extractive question answering."""
+    from transformers import pipeline
+
+    from .inference import config
+
+    options = config()
+    return pipeline('question-answering', model=options['QA_MODEL'], model_kwargs={'cache_dir': options['CACHE_DIR']})
+
+
+def convert(options, backend):
+    """Write the artifacts of ``backend``; returns the directory."""
+    import torch
+
+    directory = artifact_dir(options, backend)
+    os.makedirs(directory, exist_ok=True)
+    model, tokenizer = _load_fp32(options)
+    tokenizer.save_pretrained(directory)
+    model.config.save_pretrained(directory)
+
+    if backend == 'int8':
+        torch.save(_quantize(model).state_dict(), os.path.join(directory, 'quantized.pt'))
+    elif backend == 'onnx':
+        sample = tokenizer(['An example sentence', 'Another'], padding=True, return_tensors='pt')
+        names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+        axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+        axes['logits'] = {0: 'batch'}
+        temporary = os.path.join(directory, 'model.onnx.tmp')
+        with torch.inference_mode():
+            torch.onnx.export(
+                model, tuple(sample[name] for name in names), temporary,
+                input_names=names, output_names=['logits'], dynamic_axes=axes, opset_version=17,
+            )
+        os.replace(temporary, os.path.join(directory, 'model.onnx'))
+        with open(os.path.join(directory, 'labels.json'), 'w') as f:
+            json.dump(model.config.id2label, f)
+    else:
+        raise ValueError(f"{backend!r} has nothing to convert")
+    return directory
@@ -0,0 +1,145 @@
+import bisect
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Concurrent classification requests are collected for up to MAX_WAIT_MS (or
+# until MAX_BATCH_SIZE texts are waiting) and run through the model as one
+# padded batch, which uses the CPU's matrix units far better than one text
+# at a time. The wait is only paid when the server is idle; under load the
+# queue fills a batch before the deadline.
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+WAIT_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        return {
+            'buckets': {str(bound): count for bound, count in zip(self.buckets + ('+Inf',), self.counts)},
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class MicroBatcher:
+    """
+    Runs ``run_batch(items)`` (returning one result per item) on batches of
+    items submitted from many threads. ``submit`` returns a Future per call.
+    """
+
+    def __init__(self, run_batch, max_batch_size=32, max_wait_ms=10, max_queue=1024):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self.batches = 0
+        self.items = 0
+        self.failures = 0
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, items):
+        """Queue a list of items; the Future resolves to their results."""
+        future = Future()
+        # Large requests are not split: they form (or close) a batch themselves
+        self.queue.put_nowait((list(items), future, time.perf_counter()))
+        return future
+
+    def _collect(self):
+        requests = [self.queue.get()]
+        size = len(requests[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
+
+    def _run(self):
+        while True:
+            requests = self._collect()
+            started = time.perf_counter()
+            items = [item for request in requests for item in request[0]]
+            try:
+                results = list(self.run_batch(items)) if items else []
+            except Exception as e:
+                with self.lock:
+                    self.failures += 1
+                for _, future, _ in requests:
+                    future.set_exception(e)
+                continue
+            with self.lock:
+                self.batches += 1
+                self.items += len(items)
+                self.batch_sizes.observe(len(items))
+                for _, _, queued in requests:
+                    self.queue_wait_ms.observe((started - queued) * 1000)
+            position = 0
+            for request_items, future, _ in requests:
+                future.set_result(results[position:position + len(request_items)])
+                position += len(request_items)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'queued': self.queue.qsize(),
+                'batches': self.batches,
+                'items': self.items,
+                'failures': self.failures,
+                'batch_size': self.batch_sizes.snapshot(),
+                'queue_wait_ms': self.queue_wait_ms.snapshot(),
+            }
+
+
+def prometheus_text(metrics, prefix='sirs_inference'):
+    """Render MicroBatcher.metrics() in the Prometheus text format."""
+    lines = []
+    for name in ('batches', 'items', 'failures'):
+        lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {metrics[name]}']
+    lines += [f'# TYPE {prefix}_queued gauge', f'{prefix}_queued {metrics["queued"]}']
+    for name in ('batch_size', 'queue_wait_ms'):
+        histogram = metrics[name]
+        lines.append(f'# TYPE {prefix}_{name} histogram')
+        cumulative = 0
+        for bound, count in histogram['buckets'].items():
+            cumulative += count
+            lines.append(f'{prefix}_{name}_bucket{{le="{bound}"}} {cumulative}')
+        total = (histogram['mean'] or 0) * histogram['count']
+        lines += [f'{prefix}_{name}_sum {total}', f'{prefix}_{name}_count {histogram["count"]}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import socket
+import struct
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The chat model is loaded once, by the process started with
+# manage.py run_inference_server, and reached by the web workers over a Unix
+# socket. Messages are JSON objects, each preceded by its length as a 4-byte
+# big-endian integer. Web workers never import torch or transformers. The
+# server also holds the semantic search encoder and embeds search queries
+# (SEMANTIC_SEARCH in documents.search.semantic).
+DEFAULTS = {
+    'MODEL': 'distilbert-base-uncased-finetuned-sst-2-english',  # Needs a trained classification head
+    'BACKEND': 'torch',  # 'torch', 'int8' or 'onnx'; see chat.backends
+    'QA_MODEL': 'distilbert-base-cased-distilled-squad',
+    'THREADS': None,  # onnxruntime intra-op threads, default one per core
+    'TIMEOUT': 2.0,  # Seconds a worker waits for an answer
+    'MAX_BATCH_SIZE': 32,  # Texts run through the model together
+    'MAX_WAIT_MS': 10,  # How long a batch waits for more texts
+}
+HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class InferenceUnavailable(Exception):
+    """The inference server is not running, still loading, or failed."""
+
+
+def config():
+    options = dict(DEFAULTS)
+    options['SOCKET'] = os.path.join(settings.BASE_DIR, 'run', 'inference.sock')
+    options['CACHE_DIR'] = os.path.join(settings.BASE_DIR, 'cache', 'transformers')
+    options['ARTIFACT_DIR'] = os.path.join(settings.BASE_DIR, 'cache', 'inference')
+    options.update(getattr(settings, 'CHAT_INFERENCE', {}))
+    return options
+
+
+def send_message(sock, message):
+    data = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def _receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(sock):
+    """Read one message; returns None when the peer closed the connection."""
+    header = sock.recv(HEADER.size, socket.MSG_WAITALL)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ConnectionError("Connection closed mid-message")
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {size} bytes is too large")
+    return json.loads(_receive_exactly(sock, size))
+
+
+class InferenceClient:
+    def __init__(self, path=None, timeout=None):
+        options = config()
+        self.path = str(path or options['SOCKET'])
+        self.timeout = timeout if timeout is not None else options['TIMEOUT']
+
+    def request(self, op, **payload):
+        # A connection per request: on a Unix socket that costs microseconds
+        # and leaves nothing to go stale when the server restarts
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                send_message(sock, {'op': op, **payload})
+                response = receive_message(sock)
+        except (OSError, ValueError) as e:
+            raise InferenceUnavailable(f"Inference server unreachable: {e}") from e
+        if response is None:
+            raise InferenceUnavailable("Inference server closed the connection")
+        if not response.get('ok'):
+            raise InferenceUnavailable(response.get('error', 'Inference failed'))
+        return response
+
+    def health(self):
+        return self.request('health')
+
+    def is_ready(self):
+        try:
+            return self.request('ready')['ready']
+        except InferenceUnavailable:
+            return False
+
+    def metrics(self):
+        return self.request('metrics')['metrics']
+
+    def classify(self, texts):
+        return self.request('classify', texts=list(texts))['results']
+
+    def embed(self, texts):
+        """Return the model name and a base64 float32 vector per text."""
+        response = self.request('embed', texts=list(texts))
+        return response['model'], response['vectors']
+
+
+def classify(text):
+    """
+    Classify one text with the shared model. Returns None when the server
+    cannot answer, e.g. while it is still loading the model.
+    """
+    try:
+        return InferenceClient().classify([text])[0]
+    except InferenceUnavailable as e:
+        logger.debug("Chat classification skipped: %s", e)
+        return None
@@ -0,0 +1,207 @@
+import base64
+import logging
+import os
+import socketserver
+import threading
+import queue
+import time
+
+from .backends import load_classifier
+from documents.model_registry import registry
+from documents.search import semantic
+
+from .batching import MicroBatcher
+from .inference import config, receive_message, send_message
+
+logger = logging.getLogger(__name__)
+
+
+MODEL_NAME = 'chat-classifier'  # In the model registry
+EMBEDDING_MODEL_NAME = 'embedding'
+
+
+def load_pipeline(options):
+    """Load the classifier with the configured backend; only ever called in the server."""
+    os.makedirs(options['CACHE_DIR'], exist_ok=True)
+    return load_classifier(options)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = receive_message(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            try:
+                send_message(self.request, self.server.owner.dispatch(message))
+            except OSError:
+                return
+
+
+class _SocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # Every web worker may connect at once
+
+
+class InferenceServer:
+    """
+    Owns the models and answers ``health``, ``ready``, ``classify`` and
+    ``embed`` requests. The socket is served at once and the models are
+    loaded in the background, so clients can tell "loading" from "down".
+    """
+
+    def __init__(self, path=None, options=None, loader=load_pipeline):
+        self.options = options or config()
+        self.path = str(path or self.options['SOCKET'])
+        # Registered with this server's options, which may differ from the
+        # settings (run_inference_server --backend)
+        registry.register(MODEL_NAME, lambda: loader(self.options))
+        self.state = 'loading'
+        self.error = ''
+        self.load_seconds = None
+        self.started = time.time()
+        self.requests = 0
+        self.batcher = None
+        self.embedding_state = 'disabled' if semantic.config()['BACKEND'] == 'hashing' else 'loading'
+        self.embedding_error = ''
+        self.embedding_model = None
+        self.embed_batcher = None
+        self.server = None
+
+    def load(self):
+        self.load_classifier()
+        if self.embedding_state == 'loading':
+            self.load_embedding()
+
+    def load_classifier(self):
+        start = time.perf_counter()
+        try:
+            registry.get(MODEL_NAME)
+        except Exception as e:
+            logger.exception("Loading %s failed", self.options['MODEL'])
+            self.state, self.error = 'failed', str(e)
+            return
+        self.load_seconds = time.perf_counter() - start
+        self.batcher = MicroBatcher(
+            self.run_batch,
+            max_batch_size=self.options['MAX_BATCH_SIZE'],
+            max_wait_ms=self.options['MAX_WAIT_MS'],
+        )
+        self.state = 'ready'
+        logger.info("Loaded %s in %.1fs", self.options['MODEL'], self.load_seconds)
+
+    def load_embedding(self):
+        try:
+            self.embedding_model = registry.get(EMBEDDING_MODEL_NAME).name
+        except Exception as e:
+            logger.exception("Loading the semantic search encoder failed")
+            self.embedding_state, self.embedding_error = 'failed', str(e)
+            return
+        self.embed_batcher = MicroBatcher(
+            self.run_embed_batch,
+            max_batch_size=self.options['MAX_BATCH_SIZE'],
+            max_wait_ms=self.options['MAX_WAIT_MS'],
+        )
+        self.embedding_state = 'ready'
+        logger.info("Loaded %s", self.embedding_model)
+
+    def run_batch(self, texts):
+        # Only the batcher's thread calls the pipeline, one padded batch at a time
+        # Looked up per batch: the registry may have unloaded it to stay
+        # within its memory budget
+        classifier = registry.get(MODEL_NAME)
+        results = classifier(texts, truncation=True, batch_size=len(texts))
+        return [{'label': r['label'], 'score': float(r['score'])} for r in results]
+
+    def run_embed_batch(self, texts):
+        vectors = registry.get(EMBEDDING_MODEL_NAME).encode(texts)
+        return [base64.b64encode(vector.astype('float32').tobytes()).decode('ascii') for vector in vectors]
+
+    def dispatch(self, message):
+        op = message.get('op')
+        if op == 'health':
+            return {
+                'ok': True,
+                'state': self.state,
+                'error': self.error,
+                'model': self.options['MODEL'],
+                'backend': self.options['BACKEND'],
+                'pid': os.getpid(),
+                'uptime': time.time() - self.started,
+                'load_seconds': self.load_seconds,
+                'requests': self.requests,
+                'embedding': {
+                    'state': self.embedding_state,
+                    'error': self.embedding_error,
+                    'model': self.embedding_model,
+                },
+                'models': registry.stats(),
+            }
+        if op == 'metrics':
+            return {'ok': True, 'metrics': self.batcher.metrics() if self.batcher else None}
+        if op == 'ready':
+            return {'ok': True, 'ready': self.state == 'ready'}
+        if op == 'classify':
+            if self.state != 'ready':
+                return {'ok': False, 'error': f"Model is {self.state}" + (f": {self.error}" if self.error else '')}
+            texts = message.get('texts')
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                return {'ok': False, 'error': "'texts' must be a list of strings"}
+            self.requests += 1
+            try:
+                results = self.batcher.submit(texts).result(timeout=60)
+            except queue.Full:
+                return {'ok': False, 'error': "Server busy"}
+            except Exception as e:
+                logger.exception("Classification failed")
+                return {'ok': False, 'error': str(e)}
+            return {'ok': True, 'results': results}
+        if op == 'embed':
+            if self.embedding_state != 'ready':
+                error = f"Encoder is {self.embedding_state}"
+                return {'ok': False, 'error': error + (f": {self.embedding_error}" if self.embedding_error else '')}
+            texts = message.get('texts')
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                return {'ok': False, 'error': "'texts' must be a list of strings"}
+            self.requests += 1
+            try:
+                vectors = self.embed_batcher.submit(texts).result(timeout=60)
+            except queue.Full:
+                return {'ok': False, 'error': "Server busy"}
+            except Exception as e:
+                logger.exception("Embedding failed")
+                return {'ok': False, 'error': str(e)}
+            return {'ok': True, 'model': self.embedding_model, 'vectors': vectors}
+        return {'ok': False, 'error': f"Unknown op {op!r}"}
+
+    def bind(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(self.path)
+        self.server = _SocketServer(self.path, _Handler)
+        self.server.owner = self
+        os.chmod(self.path, 0o660)
+
+    def serve_forever(self):
+        if self.server is None:
+            self.bind()
+        threading.Thread(target=self.load, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = None
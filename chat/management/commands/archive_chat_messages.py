@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chat.archive import BATCH_SIZE, CODEC, archive_messages
+from chat.models import ChatMessage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move chat messages older than --days into compressed ChatArchive rows, "
+        "keeping the live chat table small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help="Archive messages older than this many days.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="Messages per archive row.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the messages to archive.")
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['batch_size'] < 1:
+            raise CommandError("--days must not be negative and --batch-size must be positive.")
+        before = timezone.now() - timedelta(days=options['days'])
+        if options['dry_run']:
+            count = ChatMessage.objects.filter(timestamp__lt=before).count()
+            self.stdout.write(f"{count} message(s) older than {before:%Y-%m-%d %H:%M} would be archived.")
+            return
+        archived, batches = archive_messages(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} message(s) in {batches} {CODEC} batch(es)."
+        ))
@@ -0,0 +1,134 @@
+import json
+import multiprocessing
+import queue
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.backends import BACKENDS, save_reference
+from chat.inference import config
+from documents.model_registry import rss_bytes
+
+SAMPLE_TEXTS = [
+    "Find the quarterly budget report for the finance department",
+    "Who approved the new remote work policy?",
+    "Show me the network security audit from last year",
+    "Summarize the onboarding handbook",
+    "Where is the latest version of the vendor contract?",
+    "List documents about the data retention schedule",
+    "What changed in the incident response plan?",
+    "I need the slides from the product launch meeting",
+]
+
+
+def _measure(backend, options, texts, batch_size, repeat, results):
+    # Runs in a fresh process, so every backend's memory is measured alone
+    import django
+    django.setup()
+    from chat.backends import load_classifier
+
+    try:
+        before = rss_bytes()
+        start = time.perf_counter()
+        classifier = load_classifier(options, backend)
+        load_seconds = time.perf_counter() - start
+        classifier(texts[:batch_size], batch_size=batch_size)  # Warm up
+        latencies, outputs = [], []
+        for _ in range(repeat):
+            outputs = []
+            for offset in range(0, len(texts), batch_size):
+                start = time.perf_counter()
+                outputs += classifier(texts[offset:offset + batch_size], batch_size=batch_size)
+                latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        results.put({
+            'backend': backend,
+            'load_seconds': load_seconds,
+            'rss': rss_bytes() - before,
+            'p50_ms': latencies[len(latencies) // 2] * 1000,
+            'p95_ms': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000,
+            'texts_per_second': len(texts) * repeat / sum(latencies),
+            'outputs': outputs,
+        })
+    except Exception as e:
+        results.put({'backend': backend, 'error': f"{type(e).__name__}: {e}"})
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the chat inference backends on the same texts: load time, "
+        "memory, batch latency and agreement with the fp32 torch model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--samples', type=int, default=200,
+                            help="Recent user chat messages to use as inputs, besides built-in examples.")
+        parser.add_argument('--tolerance', type=float, default=0.01,
+                            help="Largest acceptable difference in score from the torch backend.")
+        parser.add_argument('--output', help="Also write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        # Not at module level: the worker processes import this module
+        # before Django is set up
+        from chat.models import ChatMessage
+
+        settings = config()
+        texts = SAMPLE_TEXTS + list(
+            ChatMessage.objects.filter(is_user=True).order_by('-timestamp')
+            .values_list('content', flat=True)[:options['samples']]
+        )
+        backends = ['torch'] + [backend for backend in options['backends'] if backend != 'torch']
+        # Saved before any worker starts, so all of them load the same weights
+        self.stdout.write(f"Reference checkpoint: {save_reference(settings)}")
+
+        context = multiprocessing.get_context('spawn')
+        reports = []
+        for backend in backends:
+            results = context.Queue()
+            process = context.Process(
+                target=_measure,
+                args=(backend, settings, texts, options['batch_size'], options['repeat'], results),
+            )
+            process.start()
+            report = None
+            while report is None:
+                try:
+                    report = results.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        report = {'backend': backend, 'error': f"Process exited with code {process.exitcode}"}
+            process.join()
+            reports.append(report)
+        baseline = reports[0]
+        if 'error' in baseline:
+            raise CommandError(f"The torch backend failed: {baseline['error']}")
+
+        self.stdout.write(f"{len(texts)} text(s), batches of {options['batch_size']}, {options['repeat']} run(s)")
+        self.stdout.write("")
+        self.stdout.write(
+            f"{'Backend':<8}{'Load s':>8}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'Texts/s':>9}"
+            f"{'Agree':>8}{'Max diff':>10}  Verdict"
+        )
+        for report in reports:
+            if 'error' in report:
+                self.stdout.write(f"{report['backend']:<8}  {report['error']}")
+                continue
+            pairs = list(zip(baseline['outputs'], report['outputs']))
+            agree = sum(a['label'] == b['label'] for a, b in pairs) / len(pairs)
+            diff = max(abs(a['score'] - b['score']) if a['label'] == b['label'] else 1.0 for a, b in pairs)
+            report.update(agreement=agree, max_score_diff=diff, within_tolerance=diff <= options['tolerance'])
+            verdict = 'ok' if report['within_tolerance'] else 'outside tolerance'
+            self.stdout.write(
+                f"{report['backend']:<8}{report['load_seconds']:>8.1f}{report['rss'] / 2**20:>9.0f}"
+                f"{report['p50_ms']:>9.1f}{report['p95_ms']:>9.1f}{report['texts_per_second']:>9.1f}"
+                f"{agree:>8.1%}{diff:>10.4f}  {verdict}"
+            )
+
+        if options['output']:
+            for report in reports:
+                report.pop('outputs', None)
+            with open(options['output'], 'w') as f:
+                json.dump({'texts': len(texts), 'tolerance': options['tolerance'], 'backends': reports}, f, indent=2)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from chat.backends import convert, save_reference
+from chat.inference import config
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the chat model for the int8 or onnx inference backend and cache "
+        "the result under CHAT_INFERENCE['ARTIFACT_DIR']. Compare the backends "
+        "with manage.py chat_backend_report before switching CHAT_INFERENCE['BACKEND']."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['int8', 'onnx', 'all'], default='all')
+        parser.add_argument('--model', help="Model name (default: CHAT_INFERENCE['MODEL']).")
+
+    def handle(self, *args, **options):
+        settings = config()
+        if options['model']:
+            settings['MODEL'] = options['model']
+        backends = ['int8', 'onnx'] if options['backend'] == 'all' else [options['backend']]
+        self.stdout.write(f"Converting from the reference checkpoint in {save_reference(settings)}.")
+        for backend in backends:
+            directory = convert(settings, backend)
+            self.stdout.write(self.style.SUCCESS(f"Wrote the {backend} model to {directory}."))
@@ -0,0 +1,64 @@
+import json
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.backends import BACKENDS
+from chat.batching import prometheus_text
+from chat.inference import InferenceClient, InferenceUnavailable, config
+from chat.inference_server import InferenceServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the chat model once and serve it to the web workers over a Unix "
+        "socket (CHAT_INFERENCE['SOCKET']). Run one per host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help="Socket path (default: CHAT_INFERENCE['SOCKET']).")
+        parser.add_argument('--model', help="Model name (default: CHAT_INFERENCE['MODEL']).")
+        parser.add_argument('--backend', choices=BACKENDS, help="Default: CHAT_INFERENCE['BACKEND'].")
+        parser.add_argument('--status', action='store_true',
+                            help="Print the health of the running server and exit.")
+        parser.add_argument('--metrics', action='store_true',
+                            help="Print the batching metrics of the running server in the "
+                                 "Prometheus text format and exit.")
+
+    def handle(self, *args, **options):
+        settings = config()
+        if options['model']:
+            settings['MODEL'] = options['model']
+        if options['backend']:
+            settings['BACKEND'] = options['backend']
+        path = options['socket'] or settings['SOCKET']
+
+        if options['metrics']:
+            try:
+                metrics = InferenceClient(path).metrics()
+            except InferenceUnavailable as e:
+                raise CommandError(str(e))
+            if metrics is None:
+                raise CommandError("The model is not loaded yet.")
+            self.stdout.write(prometheus_text(metrics), ending='')
+            return
+
+        if options['status']:
+            try:
+                health = InferenceClient(path).health()
+            except InferenceUnavailable as e:
+                raise CommandError(str(e))
+            health.pop('ok')
+            self.stdout.write(json.dumps(health, indent=2))
+            return
+
+        server = InferenceServer(path, settings)
+        server.bind()
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+        self.stdout.write(f"Serving {settings['MODEL']} ({settings['BACKEND']}) on {server.path}; loading the model in the background.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Inference server stopped.")
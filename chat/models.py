@@ -1,13 +1,72 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from documents.models import Document
 
+class Conversation(models.Model):
+    """A thread of chat messages; the chat page shows one at a time."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations')
+    title = models.CharField(max_length=200, blank=True)  # The first message, shortened
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(default=timezone.now)  # Time of the latest message
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-updated'], name='conversation_user_recent')]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.title or 'Untitled'}"
+
 class ChatMessage(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='messages'
+    )
     content = models.TextField()
     is_user = models.BooleanField(default=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     documents = models.ManyToManyField(Document, blank=True, related_name='chat_messages')
 
+    class Meta:
+        indexes = [
+            # History is paged newest first by (timestamp, id) cursors
+            models.Index(fields=['user', '-timestamp', '-id'], name='chat_message_user_keyset'),
+            models.Index(fields=['conversation', '-timestamp', '-id'], name='chat_message_thread_keyset'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.content} ({'User' if self.is_user else 'AI'})"
+
+class ChatArchive(models.Model):
+    """
+    Cold storage for old chat messages: one compressed JSON batch of a
+    conversation's messages per row, written by archive_chat_messages.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_archives')
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='archives'
+    )
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['conversation', '-last_timestamp'], name='chat_archive_thread')]
+
+    def messages(self):
+        """The archived messages as dicts, oldest first."""
+        from .archive import read_batch
+        return read_batch(self.codec, self.data)
+
     def __str__(self):
-        return f"{self.user.username}: {self.content} ({'User' if self.is_user else 'AI'})"
\ No newline at end of file
+        return f"{self.message_count} archived message(s) of {self.user.username}"
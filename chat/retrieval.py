@@ -0,0 +1,24 @@
+from documents.acl import visibility_for
+from documents.models import Document
+from documents.search import keyword
+from documents.search.cache import result_cache
+
+# Chat answers come from the keyword index: the message is analyzed like a
+# search query (stopwords dropped, terms stemmed and weighted by BM25), the
+# ranking is restricted to what the user may see, and only the top
+# documents are loaded. Rankings are shared through the result cache by
+# users with the same access.
+MAX_DOCUMENTS = 3
+
+
+def retrieve(user, text, limit=MAX_DOCUMENTS):
+    """Return up to ``limit`` (document, score) pairs for a message, best first."""
+    visibility = visibility_for(user)
+    ranking = result_cache.ranking(
+        'chat', text, [limit], visibility,
+        lambda: keyword.search(text, limit=limit, candidates=visibility), analyzed=True,
+    )
+    if not ranking:
+        return []
+    found = Document.objects.select_related('owner').in_bulk([document_id for document_id, _ in ranking])
+    return [(found[document_id], score) for document_id, score in ranking if document_id in found]
@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.chat_interface, name='chat_interface'),
     path('send_message/', views.send_message, name='send_message'),
+    path('stream_message/', views.stream_message, name='stream_message'),
+    path('history/', views.chat_history, name='chat_history'),
 ]
\ No newline at end of file
@@ -1,49 +1,102 @@
-import threading
-import os
-from django.conf import settings
+import json
+import logging
+from asgiref.sync import sync_to_async
+from django.db.models import Sum
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import ChatMessage
-from documents.models import Document
-from transformers import pipeline
-from django.http import HttpResponseRedirect
+from django.template.loader import render_to_string
+from django.utils import timezone
+from .models import ChatMessage, Conversation
+from . import inference
+from .retrieval import retrieve
+from documents.pagination import KeysetPaginator
+from documents.search.cache import result_cache
+from django.http import Http404, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 
-# Define cache directory for Transformers model
-TRANSFORMERS_CACHE_DIR = os.path.join(settings.BASE_DIR, 'cache', 'transformers')
-os.makedirs(TRANSFORMERS_CACHE_DIR, exist_ok=True)
+logger = logging.getLogger(__name__)
 
-# Global variable to store the NLP pipeline
-NLP_PIPELINE = None
-NLP_LOADING_ERROR = None
+HISTORY_PAGE_SIZE = 20
 
-# Background model loading function
-def load_model():
-    global NLP_PIPELINE, NLP_LOADING_ERROR
-    try:
-        # Initialize Hugging Face Transformers pipeline with cache
-        NLP_PIPELINE = pipeline(
-            'text-classification',
-            model='distilbert-base-uncased',
-            cache_dir=TRANSFORMERS_CACHE_DIR
-        )
-    except Exception as e:
-        NLP_LOADING_ERROR = str(e)
+def answer_text(doc_count):
+    if doc_count == 0:
+        return "No documents found matching your query. Try refining your search."
+    return f"I found {doc_count} document{'s' if doc_count != 1 else ''} matching your query:"
+
+def error_text(error):
+    return f"Sorry, I encountered an error processing your query: {str(error)}. Please try again."
+
+def _classify(message_content):
+    # The model runs in the inference server (manage.py
+    # run_inference_server); while it loads (classify returns None),
+    # answer without it. Labels depend on the text alone and are cached.
+    options = inference.config()
+    intent = result_cache.get_or_compute(
+        'intent', [options['MODEL'], options['BACKEND'], ' '.join(message_content.split())],
+        lambda: inference.classify(message_content), versioned=False,
+    )
+    if intent is not None:
+        logger.debug("Chat query classified as %s (%.2f)", intent['label'], intent['score'])
+    return intent
 
-# Start model loading in a background thread during module import
-model_thread = threading.Thread(target=load_model)
-model_thread.daemon = True  # Daemon thread to avoid blocking server shutdown
-model_thread.start()
+def _user_conversation(user, conversation_id):
+    if not str(conversation_id or '').isdigit():
+        return None
+    return Conversation.objects.filter(user=user, pk=conversation_id).first()
+
+def _conversation(user, conversation_id, first_message):
+    """The conversation a new message goes to; a new one unless the user names one of theirs."""
+    conversation = _user_conversation(user, conversation_id)
+    if conversation is None:
+        return Conversation.objects.create(user=user, title=first_message[:200])
+    conversation.updated = timezone.now()
+    conversation.save(update_fields=['updated'])
+    return conversation
+
+def _history(conversation, token=None):
+    """
+    One page of a conversation, read newest first by (timestamp, id)
+    cursors and returned oldest first for display, with the cursor of the
+    page before it. Once the live messages run out, the number of archived
+    ones is given instead.
+    """
+    if conversation is None:
+        return {'messages': [], 'older': None, 'archived': 0}
+    messages = conversation.messages.prefetch_related('documents__owner')
+    page = KeysetPaginator(messages, HISTORY_PAGE_SIZE, ordering=('-timestamp', '-id')).page(token)
+    older = page.next_page_number() if page.has_next() else None
+    archived = 0
+    if older is None:
+        archived = conversation.archives.aggregate(total=Sum('message_count'))['total'] or 0
+    return {'messages': page.object_list[::-1], 'older': older, 'archived': archived}
 
 @login_required
 def chat_interface(request):
-    messages = ChatMessage.objects.filter(user=request.user).order_by('timestamp')[:20]
-    recent_chats = ChatMessage.objects.filter(user=request.user, is_user=True).order_by('-timestamp')[:5]
+    conversations = Conversation.objects.filter(user=request.user).order_by('-updated')
+    conversation = None
+    if 'new' not in request.GET:
+        conversation_id = request.GET.get('conversation')
+        conversation = _user_conversation(request.user, conversation_id) if conversation_id else conversations.first()
+        if conversation_id and conversation is None:
+            raise Http404("No such conversation.")
     
     return render(request, 'chat/chat.html', {
-        'messages': messages,
-        'recent_chats': recent_chats,
+        **_history(conversation),
+        'conversation': conversation,
+        'recent_chats': conversations[:10],
+    })
+
+@login_required
+def chat_history(request):
+    """Older messages of a conversation, for scrolling back on the chat page."""
+    conversation = _user_conversation(request.user, request.GET.get('conversation'))
+    if conversation is None:
+        raise Http404("No such conversation.")
+    history = _history(conversation, request.GET.get('before'))
+    return JsonResponse({
+        'html': render_to_string('chat/messages.html', history, request=request),
+        'older': history['older'],
+        'archived': history['archived'],
     })
 
 @login_required
@@ -51,44 +104,30 @@ def send_message(request):
     if request.method == 'POST':
         message_content = request.POST.get('message', '').strip()
         if message_content:
+            conversation = _conversation(request.user, request.POST.get('conversation'), message_content)
             # Save user message
             user_message = ChatMessage.objects.create(
                 user=request.user,
+                conversation=conversation,
                 content=message_content,
                 is_user=True
             )
 
             # Process query using NLP
             try:
-                if NLP_LOADING_ERROR:
-                    raise Exception(f"Model loading failed: {NLP_LOADING_ERROR}")
-                if NLP_PIPELINE is None:
-                    raise Exception("NLP model is still loading. Please try again in a moment.")
-
-                # Simple keyword extraction (for demo purposes)
-                keywords = message_content.lower().split()
-
-                # Search documents with permission filter
-                documents = Document.objects.filter(
-                    Q(title__icontains=keywords[0]) |
-                    Q(description__icontains=keywords[0]) |
-                    Q(tags__name__icontains=keywords[0])
-                ).filter(
-                    Q(owner=request.user) |
-                    Q(access_level='public') |
-                    Q(access_level='restricted', owner__groups__permissions__codename='can_view_restricted') |
-                    Q(access_level='private', owner__groups__permissions__codename='can_view_private')
-                ).distinct()[:3]
+                _classify(message_content)
+
+                # Ranked search over all terms of the message, limited to
+                # documents the user may see
+                documents = [document for document, _ in retrieve(request.user, message_content)]
 
                 # Generate AI response
-                doc_count = documents.count()
-                response_content = f"I found {doc_count} document{'s' if doc_count != 1 else ''} matching your query:"
-                if doc_count == 0:
-                    response_content = "No documents found matching your query. Try refining your search."
+                response_content = answer_text(len(documents))
 
                 # Save AI response
                 ai_message = ChatMessage.objects.create(
                     user=request.user,
+                    conversation=conversation,
                     content=response_content,
                     is_user=False
                 )
@@ -96,10 +135,55 @@ def send_message(request):
             except Exception as e:
                 ai_message = ChatMessage.objects.create(
                     user=request.user,
-                    content=f"Sorry, I encountered an error processing your query: {str(e)}. Please try again.",
+                    conversation=conversation,
+                    content=error_text(e),
                     is_user=False
                 )
 
+            return HttpResponseRedirect(f"{reverse('chat_interface')}?conversation={conversation.pk}")
         return HttpResponseRedirect(reverse('chat_interface'))
     
-    return redirect('chat_interface')
\ No newline at end of file
+    return redirect('chat_interface')
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+async def _chat_events(user, message_content, conversation_id=None):
+    """
+    Server-sent events for one chat message: 'answer' as soon as the search
+    is done, then one 'document' card at a time, then 'done'.
+    """
+    conversation = await sync_to_async(_conversation)(user, conversation_id, message_content)
+    user_message = await ChatMessage.objects.acreate(user=user, conversation=conversation, content=message_content, is_user=True)
+    yield _event('message', {'id': user_message.pk, 'conversation': conversation.pk})
+    try:
+        # Waiting on the inference server holds a worker thread, not the
+        # event loop; the search uses the ORM and so runs in the sync thread
+        await sync_to_async(_classify, thread_sensitive=False)(message_content)
+        documents = [document for document, _ in await sync_to_async(retrieve)(user, message_content)]
+        response_content = answer_text(len(documents))
+        yield _event('answer', {'text': response_content})
+        for document in documents:
+            yield _event('document', {'id': document.pk, 'html': render_to_string('chat/document_card.html', {'doc': document})})
+        ai_message = await ChatMessage.objects.acreate(user=user, conversation=conversation, content=response_content, is_user=False)
+        await ai_message.documents.aset(documents)
+        yield _event('done', {'id': ai_message.pk})
+    except Exception as e:
+        logger.warning("Chat message %s failed", user_message.pk, exc_info=True)
+        ai_message = await ChatMessage.objects.acreate(user=user, conversation=conversation, content=error_text(e), is_user=False)
+        yield _event('error', {'id': ai_message.pk, 'text': ai_message.content})
+
+@login_required
+async def stream_message(request):
+    """send_message for the chat page's script, streamed; needs the ASGI server."""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    message_content = request.POST.get('message', '').strip()
+    if not message_content:
+        return HttpResponseBadRequest("Empty message.")
+    user = await request.auser()
+    return StreamingHttpResponse(
+        _chat_events(user, message_content, request.POST.get('conversation')),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
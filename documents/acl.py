@@ -0,0 +1,183 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .keys import LRUCache
+from .models import Document, DocumentGrant, IndexChange
+
+# Who may see a document: its owner, everyone for public and internal
+# documents, and users holding a DocumentGrant for restricted or private
+# ones. Users holding the global can_view_restricted or can_view_private
+# permission (directly or through a group) see every document of that
+# level. Superusers see everything.
+OPEN_LEVELS = ('public', 'internal')
+LEVEL_CODES = {level: code for code, (level, _) in enumerate(Document.ACCESS_LEVELS, start=1)}
+PERMISSION_LEVELS = (
+    ('restricted', 'documents.can_view_restricted'),
+    ('private', 'documents.can_view_private'),
+)
+
+REFRESH_INTERVAL = 1.0  # Seconds between polls of the change log
+# Changes are re-read with this much overlap; reapplying one is harmless and
+# a transaction that committed late is still picked up.
+OVERLAP = timedelta(seconds=10)
+
+
+def visible_levels(user):
+    """Access levels whose documents the user may all see."""
+    return OPEN_LEVELS + tuple(level for level, permission in PERMISSION_LEVELS if user.has_perm(permission))
+
+
+def visible_q(user):
+    """A filter for querysets of documents the user may see."""
+    if user.is_superuser:
+        return Q()
+    return (
+        Q(access_level__in=visible_levels(user)) |
+        Q(owner=user) |
+        Q(pk__in=DocumentGrant.objects.filter(user=user).values('document_id'))
+    )
+
+
+def can_view(user, document):
+    if user.is_superuser or document.owner_id == user.pk or document.access_level in visible_levels(user):
+        return True
+    return DocumentGrant.objects.filter(user=user, document=document).exists()
+
+
+class Visibility:
+    """
+    The documents one user may see: a bitmap of the documents of the
+    levels the user sees (shared by all users with the same levels) plus
+    the user's own and granted document ids.
+    """
+
+    def __init__(self, open_mask, personal, everything=False, levels=OPEN_LEVELS):
+        self.open_mask = open_mask
+        self.personal = personal
+        self.everything = everything
+        self.levels = levels
+
+    def contains(self, ids):
+        """Boolean mask of which ``ids`` are visible."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.everything:
+            return np.ones(len(ids), dtype=bool)
+        mask = np.zeros(len(ids), dtype=bool)
+        inside = ids < len(self.open_mask)
+        mask[inside] = self.open_mask[ids[inside]]
+        if len(self.personal):
+            mask |= np.isin(ids, self.personal)
+        return mask
+
+    def filter(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return ids[self.contains(ids)]
+
+
+class VisibilityIndex:
+    """
+    In-process visibility structure, built once from the database and kept
+    current from the IndexChange log, so permission checks in search cost
+    a bitmap lookup instead of joins.
+    """
+
+    def __init__(self, personal_cache_size=4096, personal_ttl=60):
+        self.lock = threading.Lock()
+        self.levels = None  # Access level code per document id, 0 for none
+        self.masks = {}  # Visible levels -> boolean mask over document ids
+        self.since = None
+        self.last_refresh = 0.0
+        self.personal = LRUCache(personal_cache_size, personal_ttl)
+
+    def _build(self):
+        now = timezone.now()
+        rows = list(Document.objects.values_list('pk', 'access_level').iterator())
+        levels = np.zeros(max((pk for pk, _ in rows), default=-1) + 1, dtype=np.uint8)
+        for pk, level in rows:
+            levels[pk] = LEVEL_CODES.get(level, 0)
+        self.levels, self.masks, self.since = levels, {}, now
+        self.personal.clear()
+
+    def _set_level(self, document_id, level):
+        code = LEVEL_CODES.get(level, 0)
+        if document_id >= len(self.levels):
+            if not code:
+                return
+            grown = np.zeros(max(document_id + 1, len(self.levels) * 2), dtype=np.uint8)
+            grown[:len(self.levels)] = self.levels
+            self.levels = grown
+        self.levels[document_id] = code
+        # Masks already handed out keep their size; grown ones replace them
+        for levels, mask in list(self.masks.items()):
+            if document_id >= len(mask):
+                if level not in levels:
+                    continue
+                grown = np.zeros(len(self.levels), dtype=bool)
+                grown[:len(mask)] = mask
+                self.masks[levels] = mask = grown
+            mask[document_id] = level in levels
+
+    def _mask(self, levels):
+        # Called with self.lock held
+        mask = self.masks.get(levels)
+        if mask is None:
+            codes = [LEVEL_CODES[level] for level in levels]
+            mask = self.masks[levels] = np.isin(self.levels, codes)
+        return mask
+
+    def refresh(self):
+        with self.lock:
+            if self.levels is None:
+                self._build()
+                self.last_refresh = time.monotonic()
+                return
+            if time.monotonic() - self.last_refresh < REFRESH_INTERVAL:
+                return
+            self.last_refresh = time.monotonic()
+            now = timezone.now()
+            changes = list(
+                IndexChange.objects.filter(created__gte=self.since - OVERLAP)
+                .values_list('document_id', 'action', 'user_id')
+            )
+            self.since = now
+            if not changes:
+                return
+            document_ids = {document_id for document_id, action, _ in changes if action in ('index', 'delete')}
+            current = dict(
+                Document.objects.filter(pk__in=document_ids).values_list('pk', 'access_level')
+            )
+            for document_id in document_ids:
+                self._set_level(document_id, current.get(document_id))
+            for _, _, user_id in changes:
+                if user_id is not None:
+                    self.personal.discard(user_id)
+
+    def _personal_ids(self, user_id):
+        ids = self.personal.get(user_id)
+        if ids is None:
+            owned = Document.objects.filter(owner_id=user_id).values_list('pk', flat=True)
+            granted = DocumentGrant.objects.filter(user_id=user_id).values_list('document_id', flat=True)
+            ids = np.union1d(np.fromiter(owned, dtype=np.int64), np.fromiter(granted, dtype=np.int64))
+            self.personal.set(user_id, ids)
+        return ids
+
+    def for_user(self, user):
+        if user.is_superuser:
+            return Visibility(None, None, everything=True)
+        self.refresh()
+        levels = visible_levels(user)
+        with self.lock:
+            mask = self._mask(levels)
+        return Visibility(mask, self._personal_ids(user.pk), levels=levels)
+
+
+visibility_index = VisibilityIndex()
+
+
+def visibility_for(user):
+    return visibility_index.for_user(user)
@@ -1,6 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
+from django.utils import timezone
 from taggit.managers import TaggableManager
-from .models import Document
+from .counters import rate_window, recent_views
+from .models import AutoKeyword, Blob, Document, DocumentGrant, IngestionJob
+from .search.indexer import record_changes
 
 
 @admin.register(Document)
@@ -16,6 +20,7 @@ class DocumentAdmin(admin.ModelAdmin):
         "upload_date",
         "file_size",
         "security_settings",
+        "view_rate",
     )
 
     # Filters
@@ -41,6 +46,8 @@ class DocumentAdmin(admin.ModelAdmin):
         "title",
         "owner",
         "file",
+        "file_name",
+        "blob",
         "category",
         "access_level",
         "department",
@@ -53,10 +60,12 @@ class DocumentAdmin(admin.ModelAdmin):
         "watermarked",
         "audit_trail",
         "status",
+        "views",
+        "view_rate",
     )
 
     # Read-only fields
-    readonly_fields = ("upload_date", "size", "encryption_key", "views")
+    readonly_fields = ("upload_date", "size", "file_name", "blob", "encryption_key", "views", "view_rate")
 
     # List per page
     list_per_page = 25
@@ -114,6 +123,12 @@ class DocumentAdmin(admin.ModelAdmin):
 
     security_settings.short_description = "Security Settings"
 
+    def view_rate(self, obj):
+        _, hours = rate_window()
+        return f"{obj.recent_views / hours:.1f} views/hour over the last 24 hours"
+
+    view_rate.short_description = "View Rate"
+
     # Custom actions
     def mark_as_completed(self, request, queryset):
         updated = queryset.update(status="completed")
@@ -121,14 +136,22 @@ class DocumentAdmin(admin.ModelAdmin):
 
     mark_as_completed.short_description = "Mark selected documents as completed"
 
+    def _set_semantic_indexing(self, queryset, enabled):
+        # update() sends no signals, so the index changes are logged here
+        with transaction.atomic():
+            changed = list(queryset.exclude(semantic_indexing=enabled).values_list('pk', 'owner_id'))
+            updated = Document.objects.filter(pk__in=[pk for pk, _ in changed]).update(semantic_indexing=enabled)
+            record_changes(changed, fields=['semantic_indexing'])
+        return updated
+
     def enable_semantic_indexing(self, request, queryset):
-        updated = queryset.update(semantic_indexing=True)
+        updated = self._set_semantic_indexing(queryset, True)
         self.message_user(request, f"Enabled semantic indexing for {updated} document(s).")
 
     enable_semantic_indexing.short_description = "Enable semantic indexing"
 
     def disable_semantic_indexing(self, request, queryset):
-        updated = queryset.update(semantic_indexing=False)
+        updated = self._set_semantic_indexing(queryset, False)
         self.message_user(request, f"Disabled semantic indexing for {updated} document(s).")
 
     disable_semantic_indexing.short_description = "Disable semantic indexing"
@@ -147,7 +170,11 @@ class DocumentAdmin(admin.ModelAdmin):
 
     # Optimize queries
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related("owner").prefetch_related("tags")
+        # View rates are a subquery per row rather than a query per row
+        return (
+            super().get_queryset(request).select_related("owner").prefetch_related("tags")
+            .annotate(recent_views=recent_views())
+        )
 
     # Permission checks
     def has_change_permission(self, request, obj=None):
@@ -162,4 +189,51 @@ class DocumentAdmin(admin.ModelAdmin):
 
 
 # Ensure TaggableManager is properly displayed
-# admin.site.register(Document, DocumentAdmin)
\ No newline at end of file
+# admin.site.register(Document, DocumentAdmin)
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("digest", "size", "ref_count", "created")
+    search_fields = ("digest",)
+    ordering = ("-created",)
+    readonly_fields = ("digest", "file", "size", "encryption_key", "ref_count", "created")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ("document", "status", "attempts", "available_at", "locked_by", "updated")
+    list_filter = ("status",)
+    search_fields = ("document__title",)
+    ordering = ("-created",)
+    readonly_fields = ("document", "attempts", "locked_by", "locked_at", "last_error", "created", "updated")
+    actions = ["retry_jobs"]
+
+    def retry_jobs(self, request, queryset):
+        jobs = queryset.exclude(status="processing")
+        Document.objects.filter(ingestion_job__in=jobs).update(status="queued")
+        updated = jobs.update(
+            status="queued", attempts=0, available_at=timezone.now(), last_error=""
+        )
+        self.message_user(request, f"{updated} job(s) queued for retry.")
+
+    retry_jobs.short_description = "Retry selected jobs"
+
+
+@admin.register(DocumentGrant)
+class DocumentGrantAdmin(admin.ModelAdmin):
+    list_display = ("document", "user", "granted_by", "created")
+    search_fields = ("document__title", "user__username")
+    ordering = ("-created",)
+    raw_id_fields = ("document", "user", "granted_by")
+
+
+@admin.register(AutoKeyword)
+class AutoKeywordAdmin(admin.ModelAdmin):
+    list_display = ("name", "document", "score", "created")
+    search_fields = ("name", "document__title")
+    ordering = ("-created",)
+    raw_id_fields = ("document",)
@@ -0,0 +1,65 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.crypto import salted_hmac
+
+from .keys import wrap_key
+from .models import Blob
+
+
+def content_hasher():
+    """
+    Incremental keyed hash of a document's plaintext. Keying it with the
+    SECRET_KEY keeps the stored digests from confirming whether a known file
+    is in the corpus.
+    """
+    return salted_hmac('documents.blobs.content', b'', algorithm='sha256')
+
+
+def blob_name(digest):
+    return f'documents/blobs/{digest[:2]}/{digest}'
+
+
+def acquire_blob(uploaded_file):
+    """
+    Return the Blob holding ``uploaded_file``'s content with its reference
+    count incremented. A new blob takes over the upload's ciphertext and key;
+    if the content is already stored the upload's copy is discarded when the
+    request closes it.
+    """
+    digest = uploaded_file.digest
+    while True:
+        if Blob.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+            return Blob.objects.get(digest=digest)
+        try:
+            with transaction.atomic():
+                blob = Blob.objects.create(
+                    digest=digest,
+                    file=blob_name(digest),
+                    size=uploaded_file.size,
+                    stored_size=os.path.getsize(uploaded_file.temporary_file_path()),
+                    codec=uploaded_file.codec,
+                    encryption_key=wrap_key(uploaded_file.encryption_key),
+                    ref_count=1,
+                )
+                uploaded_file.move_to(os.path.join(settings.MEDIA_ROOT, blob.file.name))
+            return blob
+        except IntegrityError:
+            # Someone stored the same content concurrently; take a reference
+            # to theirs instead.
+            continue
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob, deleting it once nothing points to it."""
+    with transaction.atomic():
+        Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+        blob = Blob.objects.filter(pk=blob_id, ref_count=0).first()
+        if blob is None:
+            return
+        name = blob.file.name
+        blob.delete()
+        transaction.on_commit(lambda: default_storage.delete(name))
@@ -0,0 +1,57 @@
+import os
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional; zlib is used instead
+    zstandard = None
+
+# Codec ids as stored in the container header
+CODEC_IDS = {'none': 0, 'zlib': 1, 'zstd': 2}
+CODEC_NAMES = {value: key for key, value in CODEC_IDS.items()}
+
+# Formats that are mostly text and compress well. Office Open XML and PDF
+# files are already compressed, so they are stored as they are.
+DEFAULT_POLICY = {
+    'csv': 'zstd',
+    'txt': 'zstd',
+    'xls': 'zstd',
+    'doc': 'zstd',
+    'ppt': 'zstd',
+}
+
+
+def codec_for(file_name):
+    """Pick the codec for an upload from its extension."""
+    policy = getattr(settings, 'DOCUMENT_COMPRESSION', DEFAULT_POLICY)
+    extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+    codec = policy.get(extension, 'none')
+    if codec == 'zstd' and zstandard is None:
+        codec = 'zlib'
+    return codec
+
+
+def compressor(codec):
+    """Return a function compressing one segment. Not thread-safe; one per writer."""
+    if codec == 'none':
+        return bytes
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, 6)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress
+    raise ValueError(f"Unknown codec {codec!r}.")
+
+
+def decompressor(codec):
+    """Return a function decompressing one segment. Not thread-safe; one per reader."""
+    if codec == 'none':
+        return bytes
+    if codec == 'zlib':
+        return zlib.decompress
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is required to read this document.")
+        return zstandard.ZstdDecompressor().decompress
+    raise ValueError(f"Unknown codec {codec!r}.")
@@ -0,0 +1,186 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Document, DocumentViewBucket
+
+logger = logging.getLogger(__name__)
+
+# Document views are counted in memory and written in batches: one UPDATE
+# per distinct increment instead of a save() of the whole row per request,
+# so reading documents does not contend for the documents table. A view
+# flushes the buffer once FLUSH_INTERVAL has passed, and a timer flushes
+# what is left when no more views come in. Counts not yet flushed are lost
+# if the process is killed.
+DEFAULTS = {
+    'FLUSH_INTERVAL': 5,  # Seconds between writes
+    'BUCKET_SECONDS': 3600,  # Resolution of view rates
+    'RETENTION_DAYS': 30,  # Buckets older than this are deleted
+}
+RATE_WINDOW = timedelta(hours=24)
+
+
+def config():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'DOCUMENT_VIEW_COUNTER', {}))
+    return options
+
+
+def bucket_start(moment, seconds):
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, dt_timezone.utc)
+
+
+class ViewCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = Counter()  # document id -> views
+        self.buckets = Counter()  # (document id, bucket start) -> views
+        self.last_flush = time.monotonic()
+        self.last_prune = 0.0
+        self.timer = None
+
+    def add(self, document_id, count=1):
+        options = config()
+        start = bucket_start(timezone.now(), options['BUCKET_SECONDS'])
+        with self.lock:
+            self.pending[document_id] += count
+            self.buckets[(document_id, start)] += count
+            due = time.monotonic() - self.last_flush >= options['FLUSH_INTERVAL']
+            if not due:
+                self._schedule(options['FLUSH_INTERVAL'])
+        if due:
+            self.flush()
+
+    def _schedule(self, delay):
+        # Called with self.lock held
+        if self.timer is None:
+            self.timer = threading.Timer(delay, self._flush_later)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _flush_later(self):
+        # Runs on the timer's own thread, which has its own connection
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+        # Left over when another flush was running or the write failed
+        with self.lock:
+            if self.pending:
+                self._schedule(config()['FLUSH_INTERVAL'])
+
+    def pending_views(self, document_id):
+        with self.lock:
+            return self.pending.get(document_id, 0)
+
+    def flush(self):
+        """Write the buffered counts. Safe to call from any thread."""
+        # One flush at a time; requests arriving meanwhile keep buffering
+        if not self.flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self.lock:
+                pending, self.pending = self.pending, Counter()
+                buckets, self.buckets = self.buckets, Counter()
+                self.last_flush = time.monotonic()
+            if not pending:
+                return 0
+            try:
+                _write(pending, buckets)
+            except Exception:
+                # Keep the counts for the next attempt
+                logger.warning("Could not flush %s document view count(s)", len(pending), exc_info=True)
+                with self.lock:
+                    self.pending.update(pending)
+                    self.buckets.update(buckets)
+                return 0
+            if time.monotonic() - self.last_prune > 3600:
+                self.last_prune = time.monotonic()
+                prune_buckets()
+            return sum(pending.values())
+        finally:
+            self.flush_lock.release()
+
+
+def _write(pending, buckets):
+    # Documents with the same increment share an UPDATE, which is usually
+    # a handful of statements however many documents were viewed
+    by_count = defaultdict(list)
+    for document_id, count in pending.items():
+        by_count[count].append(document_id)
+    by_bucket = defaultdict(list)
+    for (document_id, start), count in buckets.items():
+        by_bucket[(start, count)].append(document_id)
+
+    with transaction.atomic():
+        for count, document_ids in by_count.items():
+            Document.objects.filter(pk__in=document_ids).update(views=F('views') + count)
+        for (start, count), document_ids in by_bucket.items():
+            rows = DocumentViewBucket.objects.filter(document_id__in=document_ids, start=start)
+            found = set(rows.values_list('document_id', flat=True))
+            rows.update(count=F('count') + count)
+            existing = set(Document.objects.filter(pk__in=document_ids).values_list('pk', flat=True))
+            for document_id in existing - found:
+                try:
+                    # Another process may have created the bucket meanwhile
+                    with transaction.atomic():
+                        DocumentViewBucket.objects.create(document_id=document_id, start=start, count=count)
+                except IntegrityError:
+                    DocumentViewBucket.objects.filter(document_id=document_id, start=start).update(
+                        count=F('count') + count
+                    )
+
+
+def prune_buckets():
+    cutoff = timezone.now() - timedelta(days=config()['RETENTION_DAYS'])
+    return DocumentViewBucket.objects.filter(start__lt=cutoff).delete()[0]
+
+
+def rate_window(window=RATE_WINDOW):
+    """The first bucket counted in a view rate, and the hours since."""
+    since = bucket_start(timezone.now() - window, config()['BUCKET_SECONDS'])
+    return since, max((timezone.now() - since).total_seconds() / 3600, 1 / 60)
+
+
+def recent_views(window=RATE_WINDOW):
+    """
+    Expression for annotate(): flushed views of each document over the last
+    ``window``, so a list of documents gets its rates in the same query.
+    """
+    since, _ = rate_window(window)
+    totals = (
+        DocumentViewBucket.objects.filter(document=OuterRef('pk'), start__gte=since)
+        .values('document').annotate(total=Sum('count')).values('total')
+    )
+    return Coalesce(Subquery(totals), 0)
+
+
+def view_rates(document_ids, window=RATE_WINDOW):
+    """Return {document id: views per hour} over the last ``window``, flushed views only."""
+    since, hours = rate_window(window)
+    totals = dict(
+        DocumentViewBucket.objects.filter(document_id__in=list(document_ids), start__gte=since)
+        .values('document_id').annotate(views=Sum('count')).values_list('document_id', 'views')
+    )
+    return {document_id: totals.get(document_id, 0) / hours for document_id in document_ids}
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
+
+
+def record_view(document):
+    view_counter.add(document.pk)
@@ -0,0 +1,257 @@
+import base64
+import os
+import struct
+import zlib
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .compression import CODEC_IDS, CODEC_NAMES, compressor, decompressor
+
+# Encrypted documents are stored in a segmented container:
+#
+#   header   MAGIC, version, segment size, plaintext size, segment count,
+#            the offset of the index and the compression codec
+#   segments nonce + AES-GCM ciphertext of up to SEGMENT_SIZE plaintext bytes,
+#            each compressed on its own before encryption
+#   index    (offset, length) of every segment
+#
+# Version 1 containers have no codec field and are never compressed.
+# Each segment is authenticated on its own, with its position and whether it
+# is the last one bound in as associated data, so any byte range can be read
+# by decrypting only the segments that overlap it. Files written before the
+# container existed are a single Fernet token (or newline separated tokens)
+# and are still readable through LegacyFernetReader.
+MAGIC = b'SIRSENC'
+VERSION = 2
+SEGMENT_SIZE = 64 * 1024
+NONCE_SIZE = 12
+
+HEADER_FORMATS = {1: '>7sBIQIQ', 2: '>7sBIQIQB'}
+HEADER_FORMAT = HEADER_FORMATS[VERSION]
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+INDEX_ENTRY_FORMAT = '>QI'
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+LEGACY_TOKEN_SEPARATOR = b'\n'
+
+# Text extracted from a document is kept encrypted under the document's data
+# key as well: TEXT_MAGIC, version, nonce, then AES-GCM over the
+# zlib-compressed UTF-8 text, with the document id bound in as associated
+# data. Rows without the magic are plain zlib from before.
+TEXT_MAGIC = b'SIRSTXT'
+TEXT_VERSION = 1
+
+
+class EncryptedFileError(Exception):
+    pass
+
+
+def segment_cipher(key):
+    """Derive the AES-GCM key for segments from a document's Fernet key."""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'sirs-segment-v1')
+    return AESGCM(hkdf.derive(base64.urlsafe_b64decode(key)))
+
+
+def text_cipher(key):
+    """Derive the AES-GCM key for extracted text from a document's Fernet key."""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'sirs-text-v1')
+    return AESGCM(hkdf.derive(base64.urlsafe_b64decode(key)))
+
+
+def _text_associated_data(document_id):
+    return struct.pack('>7sBQ', TEXT_MAGIC, TEXT_VERSION, document_id)
+
+
+def encrypt_text(text, key, document_id):
+    nonce = os.urandom(NONCE_SIZE)
+    ciphertext = text_cipher(key).encrypt(
+        nonce, zlib.compress(text.encode('utf-8')), _text_associated_data(document_id)
+    )
+    return TEXT_MAGIC + bytes([TEXT_VERSION]) + nonce + ciphertext
+
+
+def decrypt_text(data, key, document_id):
+    data = bytes(data)
+    if not data.startswith(TEXT_MAGIC):
+        return zlib.decompress(data).decode('utf-8')
+    start = len(TEXT_MAGIC) + 1
+    nonce, ciphertext = data[start:start + NONCE_SIZE], data[start + NONCE_SIZE:]
+    plaintext = text_cipher(key).decrypt(nonce, ciphertext, _text_associated_data(document_id))
+    return zlib.decompress(plaintext).decode('utf-8')
+
+
+def _associated_data(version, segment_size, index, final, size):
+    # The final segment also binds the plaintext size recorded in the header.
+    return struct.pack('>7sBIQ?Q', MAGIC, version, segment_size, index, final, size if final else 0)
+
+
+class SegmentWriter:
+    """
+    Writes plaintext into a segmented container as it arrives. The last
+    segment is held back until ``close`` so it can be marked final, which
+    makes truncated files fail authentication. ``fileobj`` must be seekable.
+    """
+
+    def __init__(self, fileobj, key, segment_size=SEGMENT_SIZE, codec='none'):
+        self.fileobj = fileobj
+        self.cipher = segment_cipher(key)
+        self.segment_size = segment_size
+        self.codec = codec
+        self.compress = compressor(codec)
+        self.buffer = bytearray()
+        self.size = 0
+        self.index = []
+        self.offset = HEADER_SIZE
+        self.fileobj.write(b'\0' * HEADER_SIZE)
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) > self.segment_size:
+            self._write_segment(bytes(self.buffer[:self.segment_size]), final=False)
+            del self.buffer[:self.segment_size]
+
+    def close(self):
+        self._write_segment(bytes(self.buffer), final=True)
+        self.buffer.clear()
+        index_offset = self.offset
+        self.fileobj.write(b''.join(struct.pack(INDEX_ENTRY_FORMAT, *entry) for entry in self.index))
+        self.fileobj.seek(0)
+        self.fileobj.write(struct.pack(
+            HEADER_FORMAT, MAGIC, VERSION, self.segment_size, self.size, len(self.index), index_offset,
+            CODEC_IDS[self.codec],
+        ))
+        self.fileobj.seek(0, os.SEEK_END)
+
+    def _write_segment(self, plaintext, final):
+        nonce = os.urandom(NONCE_SIZE)
+        aad = _associated_data(VERSION, self.segment_size, len(self.index), final, self.size)
+        data = nonce + self.cipher.encrypt(nonce, self.compress(plaintext), aad)
+        self.fileobj.write(data)
+        self.index.append((self.offset, len(data)))
+        self.offset += len(data)
+
+
+class SegmentReader:
+    """Random access to a segmented container; only touched segments are decrypted."""
+
+    def __init__(self, fileobj, key):
+        self.fileobj = fileobj
+        self.cipher = segment_cipher(key)
+        prefix = fileobj.read(len(MAGIC) + 1)
+        if len(prefix) < len(MAGIC) + 1 or prefix[-1] not in HEADER_FORMATS:
+            raise EncryptedFileError("Unsupported container version.")
+        header_format = HEADER_FORMATS[prefix[-1]]
+        header = prefix + fileobj.read(struct.calcsize(header_format) - len(prefix))
+        if len(header) < struct.calcsize(header_format):
+            raise EncryptedFileError("Truncated header.")
+        magic, self.version, self.segment_size, self.size, count, index_offset, *codec = struct.unpack(
+            header_format, header
+        )
+        self.codec = CODEC_NAMES.get(codec[0] if codec else 0)
+        if self.codec is None:
+            raise EncryptedFileError("Unknown compression codec.")
+        self.decompress = decompressor(self.codec)
+        if not self.segment_size or count != max(1, -(-self.size // self.segment_size)):
+            raise EncryptedFileError("Header does not match the segment count.")
+        fileobj.seek(index_offset)
+        raw_index = fileobj.read(count * INDEX_ENTRY_SIZE)
+        if len(raw_index) != count * INDEX_ENTRY_SIZE:
+            raise EncryptedFileError("Truncated segment index.")
+        self.index = [
+            struct.unpack_from(INDEX_ENTRY_FORMAT, raw_index, i * INDEX_ENTRY_SIZE) for i in range(count)
+        ]
+
+    def read_segment(self, number):
+        offset, length = self.index[number]
+        self.fileobj.seek(offset)
+        data = self.fileobj.read(length)
+        final = number == len(self.index) - 1
+        aad = _associated_data(self.version, self.segment_size, number, final, self.size)
+        try:
+            plaintext = self.cipher.decrypt(data[:NONCE_SIZE], data[NONCE_SIZE:], aad)
+        except Exception as e:
+            raise EncryptedFileError(f"Segment {number} failed authentication.") from e
+        plaintext = self.decompress(plaintext)
+        expected = self.size - number * self.segment_size if final else self.segment_size
+        if len(plaintext) != expected:
+            raise EncryptedFileError(f"Segment {number} has the wrong length.")
+        return plaintext
+
+    def iter_range(self, start=0, end=None):
+        """Yield the plaintext bytes in [start, end) one segment at a time."""
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return
+        for number in range(start // self.segment_size, (end - 1) // self.segment_size + 1):
+            segment_start = number * self.segment_size
+            plaintext = self.read_segment(number)
+            yield plaintext[max(start - segment_start, 0):end - segment_start]
+
+    def close(self):
+        self.fileobj.close()
+
+
+class LegacyFernetReader:
+    """Reads files stored as Fernet tokens. These have to be decrypted in full."""
+
+    codec = 'none'
+
+    def __init__(self, fileobj, key):
+        fernet = Fernet(key)
+        with fileobj:
+            self.plaintext = b''.join(
+                fernet.decrypt(token.rstrip(LEGACY_TOKEN_SEPARATOR))
+                for token in fileobj if token.strip()
+            )
+        self.size = len(self.plaintext)
+
+    def iter_range(self, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        if start < end:
+            yield self.plaintext[start:end]
+
+    def close(self):
+        pass
+
+
+def is_segmented(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_encrypted(path, key):
+    """Open an encrypted document, detecting the container or legacy format."""
+    f = open(path, 'rb')
+    try:
+        if f.read(len(MAGIC)) == MAGIC:
+            f.seek(0)
+            return SegmentReader(f, key)
+        f.seek(0)
+        return LegacyFernetReader(f, key)
+    except Exception:
+        f.close()
+        raise
+
+
+def decrypt_file(path, key):
+    reader = open_encrypted(path, key)
+    try:
+        return b''.join(reader.iter_range())
+    finally:
+        reader.close()
+
+
+def encrypt_chunks(chunks, path, key, codec='none'):
+    """Write an iterable of plaintext chunks to ``path`` as a container."""
+    with open(path, 'wb') as f:
+        writer = SegmentWriter(f, key, codec=codec)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        f.flush()
+        os.fsync(f.fileno())
+    return writer.size
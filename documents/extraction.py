@@ -0,0 +1,292 @@
+import csv
+import io
+import logging
+import os
+import re
+import time
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .encryption import open_encrypted
+from .models import Document, ExtractedText
+
+try:
+    import pypdf
+except ImportError:  # Optional; PDFs are not extracted without it
+    pypdf = None
+
+logger = logging.getLogger(__name__)
+
+# Extracted text is capped so a pathological file cannot fill the database.
+DEFAULT_MAX_CHARS = 5_000_000
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+S_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class DecryptedFile(io.RawIOBase):
+    """
+    A seekable, read-only file over an encrypted document. Reads decrypt only
+    the segments they touch and the last segment is kept, so parsers that do
+    many small reads (zip directories, PDF xref tables) stay cheap.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.size = reader.size
+        self.position = 0
+        self.cached = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        self.position = max(self.position, 0)
+        return self.position
+
+    def _segment(self, number):
+        if self.cached[0] != number:
+            self.cached = (number, self.reader.read_segment(number))
+        return self.cached[1]
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        if not hasattr(self.reader, 'read_segment'):
+            data = self.reader.plaintext[self.position:self.position + len(buffer)]
+        else:
+            segment_size = self.reader.segment_size
+            number, offset = divmod(self.position, segment_size)
+            data = self._segment(number)[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.reader.close()
+        super().close()
+
+
+def extract_plain_text(f):
+    text = io.TextIOWrapper(f, encoding='utf-8', errors='replace', newline='')
+    while True:
+        chunk = text.read(64 * 1024)
+        if not chunk:
+            break
+        yield chunk
+
+
+def extract_csv(f):
+    text = io.TextIOWrapper(f, encoding='utf-8', errors='replace', newline='')
+    for row in csv.reader(text):
+        yield ' '.join(cell for cell in row if cell) + '\n'
+
+
+def _iter_elements(stream, tags):
+    """
+    Yield each finished element with one of ``tags`` and then drop it from
+    the tree, so memory stays flat however large the XML part is.
+    """
+    stack = []
+    for event, element in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        if element.tag in tags:
+            yield element
+            if stack:
+                stack[-1].remove(element)
+
+
+def _iter_xml_text(stream, text_tag, break_tag):
+    for element in _iter_elements(stream, (text_tag, break_tag)):
+        if element.tag == break_tag:
+            yield '\n'
+        elif element.text:
+            yield element.text
+
+
+def _numbered(names, prefix):
+    def key(name):
+        match = re.search(r'(\d+)\.xml$', name)
+        return int(match.group(1)) if match else 0
+    return sorted((name for name in names if name.startswith(prefix) and name.endswith('.xml')), key=key)
+
+
+def extract_docx(f):
+    with zipfile.ZipFile(f) as archive:
+        with archive.open('word/document.xml') as stream:
+            yield from _iter_xml_text(stream, f'{W_NS}t', f'{W_NS}p')
+
+
+def extract_pptx(f):
+    with zipfile.ZipFile(f) as archive:
+        for name in _numbered(archive.namelist(), 'ppt/slides/slide'):
+            with archive.open(name) as stream:
+                yield from _iter_xml_text(stream, f'{A_NS}t', f'{A_NS}p')
+            yield '\n'
+
+
+def extract_xlsx(f):
+    with zipfile.ZipFile(f) as archive:
+        shared = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as stream:
+                for element in _iter_elements(stream, (f'{S_NS}si',)):
+                    shared.append(''.join(element.itertext()))
+        # Sheets are streamed row by row; whole workbooks are never loaded.
+        for name in _numbered(archive.namelist(), 'xl/worksheets/sheet'):
+            with archive.open(name) as stream:
+                row = []
+                for element in _iter_elements(stream, (f'{S_NS}c', f'{S_NS}row')):
+                    if element.tag == f'{S_NS}row':
+                        if row:
+                            yield ' '.join(row) + '\n'
+                        row = []
+                        continue
+                    cell_type = element.get('t')
+                    if cell_type == 'inlineStr':
+                        value = ''.join(element.itertext())
+                    else:
+                        value = element.findtext(f'{S_NS}v') or ''
+                        if cell_type == 's' and value.isdigit() and int(value) < len(shared):
+                            value = shared[int(value)]
+                    if value:
+                        row.append(value)
+
+
+def extract_pdf(f):
+    if pypdf is None:
+        raise ExtractionError("The pypdf package is required to extract PDF text.")
+    for page in pypdf.PdfReader(f).pages:
+        yield (page.extract_text() or '') + '\n'
+
+
+PRINTABLE_RE = re.compile(rb'[\x20-\x7e\t\r\n]{4,}')
+UTF16_RE = re.compile(rb'(?:[\x20-\x7e\t\r\n]\x00){4,}')
+
+
+def _string_runs(data):
+    for match in UTF16_RE.finditer(data):
+        yield match.start(), match.end(), match.group().decode('utf-16-le')
+    for match in PRINTABLE_RE.finditer(data):
+        yield match.start(), match.end(), match.group().decode('ascii')
+
+
+def extract_binary_strings(f):
+    """
+    Legacy binary Office formats (doc, xls, ppt) are scanned for runs of
+    ASCII and UTF-16 text, which is where their body text lives.
+    """
+    tail = b''
+    while True:
+        chunk = f.read(1024 * 1024)
+        data = tail + chunk
+        keep = len(data)
+        for start, end, text in _string_runs(data):
+            # A run reaching the end of the buffer may continue in the next
+            # chunk, so it is carried over unless it is already long.
+            if chunk and end == len(data) and end - start < 64 * 1024:
+                keep = min(keep, start)
+            else:
+                yield text + '\n'
+        if not chunk:
+            break
+        tail = data[keep:]
+
+
+EXTRACTORS = {
+    'txt': extract_plain_text,
+    'csv': extract_csv,
+    'docx': extract_docx,
+    'pptx': extract_pptx,
+    'xlsx': extract_xlsx,
+    'pdf': extract_pdf,
+    'doc': extract_binary_strings,
+    'xls': extract_binary_strings,
+    'ppt': extract_binary_strings,
+}
+
+
+def extract(document, max_chars=None):
+    """
+    Return (text, extractor name, truncated) for a document. Text is
+    collected from the extractor's chunks until ``max_chars`` is reached.
+    """
+    max_chars = max_chars or getattr(settings, 'DOCUMENT_EXTRACTION_MAX_CHARS', DEFAULT_MAX_CHARS)
+    name = document.file_name or document.file.name
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        raise ExtractionError(f"No extractor for .{extension} files.")
+
+    f = io.BufferedReader(DecryptedFile(open_encrypted(document.file.path, document.data_key)), 64 * 1024)
+    parts, length, truncated = [], 0, False
+    try:
+        for part in extractor(f):
+            if length + len(part) > max_chars:
+                parts.append(part[:max_chars - length])
+                truncated = True
+                break
+            parts.append(part)
+            length += len(part)
+    finally:
+        f.close()
+    return ''.join(parts), extractor.__name__.replace('extract_', ''), truncated
+
+
+def extract_document_text(document):
+    """Extract a document's text and store it, recording how long it took."""
+    start = time.perf_counter()
+    try:
+        text, extractor, truncated = extract(document)
+        error = ''
+    except Exception as e:
+        # A file that cannot be parsed is still a valid document; keep the
+        # error for inspection instead of failing ingestion.
+        logger.warning("Text extraction failed for document %s", document.pk, exc_info=True)
+        text, extractor, truncated, error = '', '', False, f'{type(e).__name__}: {e}'
+    duration = time.perf_counter() - start
+
+    extracted, _ = ExtractedText.objects.update_or_create(
+        document=document,
+        defaults={
+            'content': ExtractedText.seal(document, text),
+            'length': len(text),
+            'extractor': extractor,
+            'truncated': truncated,
+            'duration': duration,
+            'error': error,
+        },
+    )
+    return extracted
+
+
+def extract_document_by_id(document_id):
+    """Process pool entry point; returns (document id, seconds, error)."""
+    close_old_connections()
+    document = Document.objects.select_related('blob').get(pk=document_id)
+    extracted = extract_document_text(document)
+    return document_id, extracted.duration, extracted.error
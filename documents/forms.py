@@ -40,7 +40,7 @@ class SearchForm(forms.Form):
     search_type = forms.ChoiceField(
         choices=SEARCH_TYPES,
         required=False,
-        initial='keyword',
+        initial='hybrid',
         label='Search Type'
     )
     category = forms.ChoiceField(
@@ -67,6 +67,12 @@ class SearchForm(forms.Form):
         required=False,
         help_text="Enter tags separated by commas."
     )
+    tag_mode = forms.ChoiceField(
+        choices=[('and', 'All tags'), ('or', 'Any tag')],
+        required=False,
+        initial='and',
+        label='Match'
+    )
 
 class AccessRequestForm(forms.Form):
     reason = forms.CharField(
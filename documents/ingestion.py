@@ -0,0 +1,145 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .encryption import open_encrypted
+from .models import Document, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+# Uploads are encrypted while they are received (see upload_handlers), so the
+# request only has to store the blob and queue the document. Everything else
+# runs here, in the run_ingestion_workers processes, one stage after another.
+DEFAULT_STAGES = [
+    'documents.ingestion.verify_content',
+    'documents.extraction.extract_document_text',
+    'documents.search.indexer.queue_document',
+]
+RETRY_DELAY = 30  # Seconds, doubled on every further attempt
+
+
+def verify_content(document):
+    """Authenticate every segment of the stored file and check its size."""
+    reader = open_encrypted(document.file.path, document.data_key)
+    try:
+        size = sum(len(chunk) for chunk in reader.iter_range())
+    finally:
+        reader.close()
+    if size != document.size:
+        raise ValueError(f"Stored content is {size} bytes, expected {document.size}.")
+
+
+def get_stages():
+    return [import_string(path) for path in getattr(settings, 'DOCUMENT_INGESTION_STAGES', DEFAULT_STAGES)]
+
+
+def enqueue(document):
+    IngestionJob.objects.update_or_create(
+        document=document,
+        defaults={
+            'status': 'queued',
+            'attempts': 0,
+            'available_at': timezone.now(),
+            'locked_by': '',
+            'locked_at': None,
+            'last_error': '',
+        },
+    )
+
+
+def worker_name(number=0):
+    return f'{socket.gethostname()}:{os.getpid()}:{number}'
+
+
+def claim_job(worker):
+    """
+    Claim the next due job. Claiming is a conditional UPDATE, so concurrent
+    workers never process the same job and no broker or row locks are needed.
+    """
+    now = timezone.now()
+    candidates = IngestionJob.objects.filter(
+        status='queued', available_at__lte=now
+    ).order_by('available_at', 'id').values_list('id', flat=True)[:10]
+    for job_id in candidates:
+        claimed = IngestionJob.objects.filter(pk=job_id, status='queued').update(
+            status='processing', locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return IngestionJob.objects.select_related('document', 'document__blob').get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs(timeout):
+    """
+    Give jobs held by a worker that died back to the queue. A job that has
+    used up its attempts fails instead, as after an error: a file that
+    kills its worker would otherwise be picked up forever.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = IngestionJob.objects.filter(status='processing', locked_at__lt=cutoff)
+    exhausted = stale.filter(attempts__gte=F('max_attempts'))
+    document_ids = list(exhausted.values_list('document_id', flat=True))
+    if document_ids:
+        failed = exhausted.update(
+            status='failed', locked_by='', locked_at=None, available_at=timezone.now(),
+            last_error=f"The worker stopped responding for over {timeout}s on the last attempt.",
+        )
+        Document.objects.filter(pk__in=document_ids).update(status='failed')
+        logger.warning("Gave up on %s ingestion job(s) whose workers died on every attempt", failed)
+    return stale.update(status='queued', locked_by='', locked_at=None)
+
+
+def process_job(job, stages=None):
+    document = job.document
+    Document.objects.filter(pk=document.pk).update(status='processing')
+    try:
+        for stage in stages or get_stages():
+            stage(document)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Ingestion of document %s failed (attempt %s)", document.pk, job.attempts, exc_info=True)
+        if job.attempts >= job.max_attempts:
+            job_status = document_status = 'failed'
+            available_at = timezone.now()
+        else:
+            job_status = document_status = 'queued'
+            available_at = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        IngestionJob.objects.filter(pk=job.pk).update(
+            status=job_status, available_at=available_at, locked_by='', locked_at=None, last_error=error
+        )
+        Document.objects.filter(pk=document.pk).update(status=document_status)
+        return False
+
+    IngestionJob.objects.filter(pk=job.pk).update(status='completed', locked_by='', locked_at=None, last_error='')
+    Document.objects.filter(pk=document.pk).update(status='completed')
+    return True
+
+
+def run_worker(worker, poll_interval=1.0, stale_timeout=600, stop=None, once=False):
+    """
+    Process jobs until ``stop`` is set. With ``once`` the worker returns as
+    soon as the queue is empty.
+    """
+    stages = get_stages()
+    last_stale_check = 0.0
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        if time.monotonic() - last_stale_check > stale_timeout / 10:
+            requeue_stale_jobs(stale_timeout)
+            last_stale_check = time.monotonic()
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        process_job(job, stages)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.fernet import Fernet, MultiFernet
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Envelope encryption: every blob has its own data key, and only a copy
+# wrapped by the master key is stored in the database. The master key file
+# stands in for a KMS; it holds one Fernet key per line, newest (primary)
+# first, so keys wrapped under older master keys still unwrap until they are
+# re-wrapped by the rotate_master_key command.
+RAW_KEY_LENGTH = 44
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+_master_lock = threading.Lock()
+_master = None
+_master_mtime = None
+
+key_cache = LRUCache(
+    getattr(settings, 'DOCUMENT_KEY_CACHE_SIZE', 1024),
+    getattr(settings, 'DOCUMENT_KEY_CACHE_TTL', 300),
+)
+
+
+def master_key_file():
+    return str(settings.DOCUMENT_MASTER_KEY_FILE)
+
+
+def read_master_keys(path=None):
+    path = path or master_key_file()
+    with open(path, 'rb') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_master_keys(keys, path=None):
+    path = path or master_key_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b'\n'.join(keys) + b'\n')
+    os.replace(temp_path, path)
+
+
+def master_key():
+    """
+    The process-wide MultiFernet over the master keys. It is loaded on first
+    use and reloaded when the key file changes, so a rotation is picked up by
+    running processes without a restart. The file is never created here:
+    a new key would not unwrap any stored data key.
+    """
+    global _master, _master_mtime
+    path = master_key_file()
+    with _master_lock:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise ImproperlyConfigured(
+                f"The master key file {path} does not exist. Check DOCUMENT_MASTER_KEY_FILE "
+                "(SIRS_MASTER_KEY_FILE), or create the first key with manage.py rotate_master_key --generate."
+            )
+        if _master is None or mtime != _master_mtime:
+            _master = MultiFernet([Fernet(key) for key in read_master_keys(path)])
+            _master_mtime = mtime
+        return _master
+
+
+def wrap_key(data_key):
+    return master_key().encrypt(data_key)
+
+
+def unwrap_key(stored_key):
+    """
+    Return the raw data key for a stored key. Keys written before envelope
+    encryption are raw Fernet keys and are returned unchanged. Unwrapped keys
+    are cached, so hot documents skip the unwrap.
+    """
+    stored_key = bytes(stored_key)
+    if len(stored_key) == RAW_KEY_LENGTH:
+        return stored_key
+    data_key = key_cache.get(stored_key)
+    if data_key is None:
+        data_key = master_key().decrypt(stored_key)
+        key_cache.set(stored_key, data_key)
+    return data_key
+
+
+def rewrap_key(stored_key):
+    """Wrap a stored key under the current primary master key."""
+    stored_key = bytes(stored_key)
+    if len(stored_key) == RAW_KEY_LENGTH:
+        return wrap_key(stored_key)
+    return master_key().rotate(stored_key)
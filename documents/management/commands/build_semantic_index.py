@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.search import semantic
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed documents that have no vector for the current model, in batches, "
+        "then write a new memory-mapped snapshot of all vectors for semantic search."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-embed every document first.")
+        parser.add_argument('--no-embed', action='store_true', help="Only rebuild the snapshot.")
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help="Documents loaded per batch; encoding uses SEMANTIC_SEARCH['BATCH_SIZE'].")
+
+    def handle(self, *args, **options):
+        encoder = semantic.get_encoder()
+        self.stdout.write(f"Encoder: {encoder.name}")
+
+        start = time.perf_counter()
+        if not options['no_embed']:
+            documents = Document.objects.filter(semantic_indexing=True)
+            if not options['all']:
+                documents = documents.exclude(embedding__model=encoder.name)
+            embedded, last = 0, 0
+            while True:
+                batch = list(
+                    documents.filter(pk__gt=last).order_by('pk')
+                    .select_related('extracted_text', 'blob').prefetch_related('tags')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                embedded += semantic.embed_documents(batch)
+                last = batch[-1].pk
+                self.stdout.write(f"  embedded {embedded} document(s)")
+            self.stdout.write(f"Embedded {embedded} document(s) in {time.perf_counter() - start:.1f}s.")
+
+        start = time.perf_counter()
+        snapshot = semantic.build_snapshot(encoder.name)
+        index = f"IVF with {snapshot.meta['lists']} lists" if snapshot.meta['lists'] else "exact scan"
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote a snapshot of {snapshot.meta['count']} vector(s) ({snapshot.meta['dtype']}, {index}) "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.template.defaultfilters import filesizeformat
+
+from documents.models import Blob, Document
+
+
+class Command(BaseCommand):
+    help = "Report the disk space saved by deduplication and compression across the corpus."
+
+    def handle(self, *args, **options):
+        logical = Document.objects.aggregate(total=Sum('size'))['total'] or 0
+        blobs = Blob.objects.aggregate(plaintext=Sum('size'), stored=Sum('stored_size'), count=Count('id'))
+
+        # Documents stored before blobs existed still own a file each
+        legacy_plaintext = legacy_stored = 0
+        for document in Document.objects.filter(blob__isnull=True).only('size', 'file').iterator():
+            legacy_plaintext += document.size
+            try:
+                legacy_stored += os.path.getsize(document.file.path)
+            except (OSError, ValueError):
+                pass
+
+        unique = (blobs['plaintext'] or 0) + legacy_plaintext
+        stored = (blobs['stored'] or 0) + legacy_stored
+
+        self.stdout.write(f"Documents:              {Document.objects.count()}")
+        self.stdout.write(f"Uploaded (logical):     {filesizeformat(logical)}")
+        self.stdout.write(f"Unique content:         {filesizeformat(unique)} in {blobs['count']} blob(s)"
+                          f" and {Document.objects.filter(blob__isnull=True).count()} legacy file(s)")
+        self.stdout.write(f"Stored on disk:         {filesizeformat(stored)}")
+        self.stdout.write(f"Saved by deduplication: {filesizeformat(logical - unique)}")
+        self.stdout.write(f"Saved by compression:   {filesizeformat(unique - stored)}")
+        self.stdout.write("")
+        self.stdout.write(f"{'Codec':<8}{'Blobs':>8}{'Plaintext':>14}{'Stored':>14}{'Ratio':>8}")
+        rows = Blob.objects.values('codec').annotate(
+            count=Count('id'), plaintext=Sum('size'), stored=Sum('stored_size')
+        ).order_by('codec')
+        for row in rows:
+            plaintext, stored = row['plaintext'] or 0, row['stored'] or 0
+            ratio = f"{plaintext / stored:.2f}x" if stored else '-'
+            self.stdout.write(
+                f"{row['codec']:<8}{row['count']:>8}{filesizeformat(plaintext):>14}"
+                f"{filesizeformat(stored):>14}{ratio:>8}"
+            )
@@ -0,0 +1,70 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.compression import codec_for
+from documents.encryption import encrypt_chunks, is_segmented, open_encrypted
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert documents stored as whole-file Fernet tokens into the segmented "
+        "container format. Safe to run in the background next to the web server "
+        "and to interrupt: converted files are skipped on the next run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help="Seconds to pause between files to limit I/O load.")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Convert at most this many files.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many files need converting.")
+
+    def handle(self, *args, **options):
+        converted = skipped = failed = 0
+        # Blobs are always written as containers
+        documents = Document.objects.filter(blob__isnull=True).exclude(file='').only(
+            'id', 'file', 'file_name', 'encryption_key'
+        ).order_by('id')
+        for document in documents.iterator(chunk_size=500):
+            if options['limit'] is not None and converted >= options['limit']:
+                break
+            path = document.file.path
+            if not os.path.exists(path) or is_segmented(path):
+                skipped += 1
+                continue
+            if options['dry_run']:
+                converted += 1
+                continue
+            try:
+                self.convert(path, document.data_key, codec_for(document.file_name or path))
+                converted += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Document {document.id}: {e}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        verb = "Would convert" if options['dry_run'] else "Converted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {converted} file(s), skipped {skipped}, failed {failed}."
+        ))
+
+    def convert(self, path, key, codec):
+        # Write next to the original and swap atomically, so readers holding
+        # the old file open are unaffected and an interrupted run leaves the
+        # original in place.
+        temp_path = f'{path}.converting'
+        reader = open_encrypted(path, key)
+        try:
+            encrypt_chunks(reader.iter_range(), temp_path, key, codec)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            reader.close()
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.models import Document
+from documents.search.indexer import BATCH_SIZE, run_indexer
+from documents.search.keywords import MAX_KEYWORDS, apply_keyword_changes, extract_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the top TF-IDF keywords of newly ingested documents, following "
+        "the search index change log with its own watermark. Documents with "
+        "auto_keyword_extraction turned off are skipped. --all re-extracts every "
+        "document once instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-extract keywords for every document and exit.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--limit', type=int, default=MAX_KEYWORDS, help="Keywords per document.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when there are no new changes.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the log is drained instead of polling.")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            start = time.perf_counter()
+            count = extract_queryset(Document.objects.all(), options['batch_size'], options['limit'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Extracted keywords for {count} document(s) in {time.perf_counter() - start:.1f}s."
+            ))
+            return
+
+        limit = options['limit']
+        try:
+            state = run_indexer(
+                name='keywords',
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+                apply=lambda changes: apply_keyword_changes(changes, limit),
+            )
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"Keyword extraction stopped at change {state.last_change_id}.")
@@ -0,0 +1,58 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+# Models are imported lazily: with the spawn start method the pool imports
+# this module in each child before Django is set up.
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _extract(document_id):
+    from documents.extraction import extract_document_by_id
+    return extract_document_by_id(document_id)
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract text from documents in a process pool. By default only documents "
+        "without extracted text are processed; the slowest files are listed at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--all', action='store_true', help="Re-extract every document.")
+        parser.add_argument('--failed', action='store_true', help="Retry documents whose extraction failed.")
+        parser.add_argument('--slowest', type=int, default=10, help="Number of slowest files to list.")
+
+    def handle(self, *args, **options):
+        from documents.models import Document
+
+        documents = Document.objects.all()
+        if options['failed']:
+            documents = documents.filter(extracted_text__isnull=False).exclude(extracted_text__error='')
+        elif not options['all']:
+            documents = documents.filter(extracted_text__isnull=True)
+        ids = list(documents.order_by('id').values_list('id', flat=True))
+        if not ids:
+            self.stdout.write("Nothing to extract.")
+            return
+
+        connections.close_all()
+        timings, failures = [], 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_extract, document_id) for document_id in ids]
+            for future in as_completed(futures):
+                document_id, duration, error = future.result()
+                timings.append((duration, document_id))
+                if error:
+                    failures += 1
+                    self.stderr.write(f"Document {document_id}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Extracted {len(ids) - failures} document(s), {failures} failed."))
+        for duration, document_id in sorted(timings, reverse=True)[:options['slowest']]:
+            self.stdout.write(f"  {duration:8.2f}s  document {document_id}")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.models import Document, SearchDocument, SearchPosting
+from documents.search.keyword import index_queryset
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the keyword search index. By default only documents missing from "
+        "the index are added; --all rebuilds it from scratch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Drop the index and reindex every document.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        documents = Document.objects.all()
+        if options['all']:
+            SearchPosting.objects.all().delete()
+            SearchDocument.objects.all().delete()
+        else:
+            documents = documents.filter(search_entry__isnull=True)
+
+        start = time.perf_counter()
+        count = index_queryset(documents, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} document(s) in {time.perf_counter() - start:.1f}s; "
+            f"{SearchPosting.objects.count()} postings row(s)."
+        ))
@@ -0,0 +1,80 @@
+import os
+
+from cryptography.fernet import Fernet
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Length
+
+from documents.keys import (
+    RAW_KEY_LENGTH, master_key, master_key_file, read_master_keys, rewrap_key, write_master_keys,
+)
+from documents.models import Blob, Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-wrap every stored data key under the primary master key. With "
+        "--generate a new primary master key is added first (or the key file is "
+        "created, on a new installation); with --retire the "
+        "old master keys are removed once nothing is wrapped under them. Raw "
+        "keys from before envelope encryption are wrapped as well."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true', help="Add a new primary master key.")
+        parser.add_argument('--retire', action='store_true', help="Drop old master keys afterwards.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = master_key_file()
+        if options['generate']:
+            if os.path.exists(path):
+                write_master_keys([Fernet.generate_key()] + read_master_keys())
+                self.stdout.write(f"Added a new primary master key to {path}.")
+            elif self.has_wrapped_keys():
+                raise CommandError(
+                    f"{path} does not exist, but stored data keys are wrapped under a master key. "
+                    "Restore the key file (or fix DOCUMENT_MASTER_KEY_FILE) instead of creating a new one."
+                )
+            else:
+                write_master_keys([Fernet.generate_key()])
+                self.stdout.write(f"Created the master key file {path}.")
+        try:
+            master_key()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        rewrapped = 0
+        for model in (Blob, Document):
+            rewrapped += self.rewrap(model, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Re-wrapped {rewrapped} key(s)."))
+
+        if options['retire']:
+            write_master_keys(read_master_keys()[:1])
+            self.stdout.write("Retired old master keys.")
+
+    def has_wrapped_keys(self):
+        return any(
+            model.objects.alias(length=Length('encryption_key')).filter(length__gt=RAW_KEY_LENGTH).exists()
+            for model in (Blob, Document)
+        )
+
+    def rewrap(self, model, batch_size):
+        count = 0
+        queryset = model.objects.exclude(encryption_key=b'').only('id', 'encryption_key').order_by('id')
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            obj.encryption_key = rewrap_key(obj.encryption_key)
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                count += self.save(model, batch)
+                batch = []
+        if batch:
+            count += self.save(model, batch)
+        return count
+
+    def save(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, ['encryption_key'])
+        return len(batch)
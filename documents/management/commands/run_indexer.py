@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from documents.search.indexer import BATCH_SIZE, run_indexer
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the search index change log to the keyword and vector indexes in "
+        "batches. Progress is kept as a watermark, so a restarted indexer resumes "
+        "where it stopped. Run a single indexer per database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when there are no new changes.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the log is drained instead of polling.")
+
+    def handle(self, *args, **options):
+        try:
+            state = run_indexer(
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"Indexer stopped at change {state.last_change_id}.")
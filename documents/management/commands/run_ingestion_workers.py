@@ -0,0 +1,76 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_entry(number, poll_interval, stale_timeout, once, stop):
+    # Runs in a child process; with the spawn start method Django has to be
+    # set up again before models can be imported.
+    import django
+    django.setup()
+    from documents.ingestion import run_worker, worker_name
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(
+        worker_name(number),
+        poll_interval=poll_interval,
+        stale_timeout=stale_timeout,
+        stop=stop,
+        once=once,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a pool of worker processes that take queued documents from the "
+        "ingestion table and process them, retrying failures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes (default: one per CPU).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--stale-timeout', type=int, default=600,
+                            help="Seconds after which a job held by a dead worker is requeued.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            from documents.ingestion import run_worker, worker_name
+            try:
+                run_worker(worker_name(), options['poll_interval'], options['stale_timeout'], once=options['once'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        stop = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=_worker_entry,
+                args=(number, options['poll_interval'], options['stale_timeout'], options['once'], stop),
+                daemon=True,
+            )
+            for number in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} ingestion worker(s).")
+
+        def shutdown(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for process in processes:
+                process.join()
+        self.stdout.write("Ingestion workers stopped.")
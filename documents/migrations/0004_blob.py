@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:55
+
+import os
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_file_names(apps, schema_editor):
+    # Legacy files were stored as documents/encrypted_<owner id>_<name>
+    Document = apps.get_model('documents', 'Document')
+    for document in Document.objects.filter(file_name='').only('id', 'owner_id', 'file'):
+        name = os.path.basename(document.file.name)
+        prefix = f'encrypted_{document.owner_id}_'
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+        Document.objects.filter(pk=document.pk).update(file_name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_accessrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=255, upload_to='documents/blobs/')),
+                ('size', models.BigIntegerField()),
+                ('encryption_key', models.BinaryField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='encryption_key',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='documents.blob'),
+        ),
+        migrations.RunPython(fill_file_names, migrations.RunPython.noop),
+    ]
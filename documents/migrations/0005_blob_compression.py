@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:58
+
+import os
+
+from django.db import migrations, models
+
+
+def fill_stored_sizes(apps, schema_editor):
+    Blob = apps.get_model('documents', 'Blob')
+    for blob in Blob.objects.filter(stored_size__isnull=True).only('id', 'file'):
+        try:
+            stored_size = os.path.getsize(blob.file.path)
+        except OSError:
+            continue
+        Blob.objects.filter(pk=blob.pk).update(stored_size=stored_size)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='codec',
+            field=models.CharField(choices=[('none', 'None'), ('zlib', 'zlib'), ('zstd', 'Zstandard')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='stored_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_stored_sizes, migrations.RunPython.noop),
+    ]
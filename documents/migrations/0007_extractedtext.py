@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.BinaryField()),
+                ('length', models.PositiveIntegerField(default=0)),
+                ('extractor', models.CharField(blank=True, max_length=50)),
+                ('truncated', models.BooleanField(default=False)),
+                ('duration', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='extracted_text', to='documents.document')),
+            ],
+        ),
+    ]
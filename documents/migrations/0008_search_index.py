@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_extractedtext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='documents.document')),
+                ('length', models.FloatField(default=0)),
+                ('terms', models.TextField(blank=True)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('block', models.PositiveIntegerField()),
+                ('postings', models.BinaryField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'block'), name='unique_search_posting')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentEmbedding',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='embedding', serialize=False, to='documents.document')),
+                ('model', models.CharField(max_length=100)),
+                ('vector', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
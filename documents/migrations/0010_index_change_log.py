@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def queue_existing_documents(apps, schema_editor):
+    # Existing documents are indexed by the first run of run_indexer
+    Document = apps.get_model('documents', 'Document')
+    IndexChange = apps.get_model('documents', 'IndexChange')
+    ids = Document.objects.order_by('pk').values_list('pk', flat=True)
+    IndexChange.objects.bulk_create(
+        (IndexChange(document_id=document_id, action='index') for document_id in ids.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_documentembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('index', 'Index'), ('delete', 'Delete')], max_length=10)),
+                ('fields', models.CharField(blank=True, max_length=255)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IndexerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_change_id', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='searchdocument',
+            name='document',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='documents.document'),
+        ),
+        migrations.RunPython(queue_existing_documents, migrations.RunPython.noop),
+    ]
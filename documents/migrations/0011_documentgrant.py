@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def grants_from_groups(apps, schema_editor):
+    # Approved requests used to add the requester to an Access_<document id>
+    # group holding a global view permission; keep the access, drop the groups.
+    Group = apps.get_model('auth', 'Group')
+    Document = apps.get_model('documents', 'Document')
+    DocumentGrant = apps.get_model('documents', 'DocumentGrant')
+    for group in Group.objects.filter(name__startswith='Access_'):
+        document_id = group.name[len('Access_'):]
+        if not document_id.isdigit() or not Document.objects.filter(pk=document_id).exists():
+            continue
+        for user_id in group.user_set.values_list('pk', flat=True):
+            DocumentGrant.objects.get_or_create(document_id=int(document_id), user_id=user_id)
+        group.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_index_change_log'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexchange',
+            name='user_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='indexchange',
+            name='action',
+            field=models.CharField(choices=[('index', 'Index'), ('delete', 'Delete'), ('grant', 'Grant'), ('revoke', 'Revoke')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='DocumentGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grants', to='documents.document')),
+                ('granted_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_grants', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'document'), name='unique_document_grant')],
+            },
+        ),
+        migrations.RunPython(grants_from_groups, migrations.RunPython.noop),
+    ]
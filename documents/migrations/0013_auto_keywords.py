@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def count_postings(apps, schema_editor):
+    SearchPosting = apps.get_model('documents', 'SearchPosting')
+    rows = []
+    for row in SearchPosting.objects.only('pk', 'postings').iterator():
+        row.document_count = len(row.postings) // 12  # Size of a packed posting
+        rows.append(row)
+        if len(rows) == 500:
+            SearchPosting.objects.bulk_update(rows, ['document_count'])
+            rows = []
+    SearchPosting.objects.bulk_update(rows, ['document_count'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_keyset_indexes'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchposting',
+            name='document_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AutoKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auto_keywords', to='documents.document')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taggit.tag')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('document', 'tag'), name='unique_auto_keyword')],
+            },
+        ),
+        migrations.RunPython(count_postings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+def untag_auto_keywords(apps, schema_editor):
+    # Extracted keywords were added to the shared taggit tables; keep them
+    # on AutoKeyword only
+    AutoKeyword = apps.get_model('documents', 'AutoKeyword')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type = ContentType.objects.filter(app_label='documents', model='document').first()
+    for keyword in AutoKeyword.objects.select_related('tag').iterator():
+        keyword.name = keyword.tag.name[:100]
+        keyword.save(update_fields=['name'])
+        if content_type is not None:
+            TaggedItem.objects.filter(
+                content_type=content_type, object_id=keyword.document_id, tag_id=keyword.tag_id
+            ).delete()
+
+
+def delete_unused_keyword_tags(apps, schema_editor):
+    # Only once AutoKeyword no longer points at them
+    AutoKeyword = apps.get_model('documents', 'AutoKeyword')
+    Tag = apps.get_model('taggit', 'Tag')
+    names = set(AutoKeyword.objects.values_list('name', flat=True))
+    Tag.objects.filter(name__in=names, taggit_taggeditem_items__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('documents', '0014_view_buckets'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autokeyword',
+            name='name',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(untag_auto_keywords, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='autokeyword',
+            name='unique_auto_keyword',
+        ),
+        migrations.RemoveField(
+            model_name='autokeyword',
+            name='tag',
+        ),
+        migrations.RunPython(delete_unused_keyword_tags, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='autokeyword',
+            options={'ordering': ['-score']},
+        ),
+        migrations.AddConstraint(
+            model_name='autokeyword',
+            constraint=models.UniqueConstraint(fields=('document', 'name'), name='unique_auto_keyword_name'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+import zlib
+
+from django.db import migrations
+
+from documents.encryption import TEXT_MAGIC, encrypt_text
+from documents.keys import unwrap_key
+
+
+def encrypt_extracted_text(apps, schema_editor):
+    # Extracted text used to be stored zlib-compressed only; seal it with
+    # the document's data key like the file itself
+    ExtractedText = apps.get_model('documents', 'ExtractedText')
+    rows = ExtractedText.objects.exclude(content=b'').select_related('document__blob')
+    for row in rows.iterator():
+        content = bytes(row.content)
+        if content.startswith(TEXT_MAGIC):
+            continue
+        document = row.document
+        key = unwrap_key(document.blob.encryption_key if document.blob_id else document.encryption_key)
+        text = zlib.decompress(content).decode('utf-8')
+        row.content = encrypt_text(text, key, document.pk)
+        row.save(update_fields=['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_auto_keywords_untagged'),
+    ]
+
+    operations = [
+        migrations.RunPython(encrypt_extracted_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def remove_access_groups(apps, schema_editor):
+    # Access_<document id> groups held the global can_view_restricted and
+    # can_view_private permissions, which documents.acl honours again. Turn
+    # any memberships 0011 left behind into grants and drop every such
+    # group, including those of deleted documents.
+    Group = apps.get_model('auth', 'Group')
+    Document = apps.get_model('documents', 'Document')
+    DocumentGrant = apps.get_model('documents', 'DocumentGrant')
+    for group in Group.objects.filter(name__startswith='Access_'):
+        document_id = group.name[len('Access_'):]
+        if document_id.isdigit() and Document.objects.filter(pk=document_id).exists():
+            for user_id in group.user_set.values_list('pk', flat=True):
+                DocumentGrant.objects.get_or_create(document_id=int(document_id), user_id=user_id)
+        group.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('documents', '0016_encrypt_extracted_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_access_groups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,153 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Machine learning models are loaded on first use, never at import, so
+# processes that do not need them (migrate, shell, most web requests) never
+# import torch. A process holds its models under a memory budget: the growth
+# in RSS while a model loaded is taken as its size, and the least recently
+# used models are dropped when the total exceeds the budget.
+DEFAULTS = {
+    'BUDGET_MB': 2048,
+    'MODELS': {
+        'embedding': 'documents.search.semantic.load_transformer_encoder',
+        'chat-classifier': 'chat.backends.load_configured_classifier',
+        'qa': 'chat.backends.load_qa_pipeline',
+    },
+}
+
+
+def config():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'MODEL_REGISTRY', {}))
+    return options
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Entry:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.model = None
+        self.size = 0
+        self.load_seconds = None
+        self.loads = 0
+        self.hits = 0
+        self.last_used = None
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, budget_mb=None, loaders=None):
+        self.budget_mb = budget_mb
+        self.loaders = loaders
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loaded = OrderedDict()  # name -> entry, least recently used first
+
+    def _options(self):
+        options = config()
+        if self.budget_mb is not None:
+            options['BUDGET_MB'] = self.budget_mb
+        if self.loaders is not None:
+            options['MODELS'] = self.loaders
+        return options
+
+    def _entry(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                models = self._options()['MODELS']
+                if name not in models:
+                    raise KeyError(f"No model named {name!r} is registered")
+                entry = self.entries[name] = _Entry(name, models[name])
+            return entry
+
+    def register(self, name, loader):
+        """Add or replace a model; ``loader`` is a callable or a dotted path."""
+        self.unload(name)
+        with self.lock:
+            self.entries[name] = _Entry(name, loader)
+
+    def get(self, name):
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.model is None:
+                loader = import_string(entry.loader) if isinstance(entry.loader, str) else entry.loader
+                before, start = rss_bytes(), time.perf_counter()
+                entry.model = loader()
+                entry.load_seconds = time.perf_counter() - start
+                entry.size = max(rss_bytes() - before, 0)
+                entry.loads += 1
+                logger.info("Loaded model %s in %.1fs (%.0f MB)", name, entry.load_seconds, entry.size / 2**20)
+            else:
+                entry.hits += 1
+            entry.last_used = time.time()
+            model = entry.model
+        with self.lock:
+            self.loaded[name] = entry
+            self.loaded.move_to_end(name)
+        self._enforce_budget(keep=name)
+        return model
+
+    def _enforce_budget(self, keep):
+        budget = self._options()['BUDGET_MB'] * 2**20
+        while True:
+            with self.lock:
+                total = sum(entry.size for entry in self.loaded.values())
+                victims = [name for name in self.loaded if name != keep]
+                if total <= budget or not victims:
+                    return
+                victim = victims[0]
+            logger.info("Unloading model %s to stay within %s MB", victim, budget // 2**20)
+            self.unload(victim)
+
+    def unload(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            self.loaded.pop(name, None)
+        if entry is None:
+            return False
+        with entry.lock:
+            unloaded = entry.model is not None
+            entry.model = None
+            entry.size = 0
+        if unloaded:
+            gc.collect()
+        return unloaded
+
+    def stats(self):
+        """Load times, sizes and use counts of every model touched so far."""
+        with self.lock:
+            entries = list(self.entries.values())
+        return [
+            {
+                'name': entry.name,
+                'loaded': entry.model is not None,
+                'size_mb': round(entry.size / 2**20, 1),
+                'load_seconds': entry.load_seconds,
+                'loads': entry.loads,
+                'hits': entry.hits,
+                'last_used': entry.last_used,
+            }
+            for entry in entries
+        ]
+
+
+registry = ModelRegistry()
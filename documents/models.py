@@ -2,6 +2,36 @@ from django.db import models
 from django.conf import settings
 from taggit.managers import TaggableManager
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
+from .encryption import decrypt_text, encrypt_text
+from .keys import unwrap_key
+
+class Blob(models.Model):
+    """
+    Encrypted file content shared by every document with the same bytes.
+    ``digest`` is a keyed hash of the plaintext, so identical uploads map to
+    one stored file; ``ref_count`` is the number of documents pointing here.
+    ``size`` is the plaintext size and ``stored_size`` the size on disk after
+    compression and encryption.
+    """
+    CODECS = (
+        ('none', 'None'),
+        ('zlib', 'zlib'),
+        ('zstd', 'Zstandard'),
+    )
+
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='documents/blobs/', max_length=255)
+    size = models.BigIntegerField()
+    stored_size = models.BigIntegerField(null=True, blank=True)
+    codec = models.CharField(max_length=10, choices=CODECS, default='none')
+    # Data key wrapped by the master key; see documents.keys
+    encryption_key = models.BinaryField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
 
 class Document(models.Model):
     ACCESS_LEVELS = (
@@ -51,13 +81,22 @@ class Document(models.Model):
         upload_to='documents/',
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'txt', 'xls', 'xlsx', 'ppt', 'pptx', 'csv'])]
     )
+    file_name = models.CharField(max_length=255, blank=True)
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='documents'
+    )
     size = models.BigIntegerField()
     category = models.CharField(max_length=50, choices=CATEGORIES, default='other')
     access_level = models.CharField(max_length=20, choices=ACCESS_LEVELS, default='private')
     department = models.CharField(max_length=50, choices=DEPARTMENTS, default='none', blank=True)
     description = models.TextField(blank=True)
     tags = TaggableManager(blank=True)
-    encryption_key = models.BinaryField()
+    # Only set for documents stored before blobs existed; see data_key
+    encryption_key = models.BinaryField(blank=True, default=b'')
     upload_date = models.DateTimeField(auto_now_add=True)
     views = models.PositiveIntegerField(default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
@@ -75,10 +114,236 @@ class Document(models.Model):
             ('can_view_restricted', 'Can view restricted documents'),
             ('can_view_private', 'Can view private documents'),
         ]
+        indexes = [
+            # Keyset pagination of listings, see documents.pagination
+            models.Index(fields=['-upload_date', '-id'], name='document_upload_keyset'),
+            models.Index(fields=['owner', '-upload_date', '-id'], name='document_owner_keyset'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @property
+    def data_key(self):
+        return unwrap_key(self.blob.encryption_key if self.blob_id else self.encryption_key)
+
+class ExtractedText(models.Model):
+    """
+    Plain text pulled out of a document's file, stored compressed and
+    encrypted with the document's data key (see documents.encryption).
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='extracted_text'
+    )
+    content = models.BinaryField()
+    length = models.PositiveIntegerField(default=0)  # Characters
+    extractor = models.CharField(max_length=50, blank=True)
+    truncated = models.BooleanField(default=False)
+    duration = models.FloatField(default=0)  # Seconds spent extracting
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.document}"
+
+    @staticmethod
+    def seal(document, text):
+        return encrypt_text(text, document.data_key, document.pk)
+
+    @property
+    def text(self):
+        if not self.content:
+            return ''
+        return decrypt_text(self.content, self.document.data_key, self.document_id)
+
+class IngestionJob(models.Model):
+    """
+    Queue entry for the background processing of an uploaded document. Rows
+    are claimed by the run_ingestion_workers processes; see documents.ingestion.
+    """
+    STATUS_CHOICES = Document.STATUS_CHOICES
+
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='ingestion_job'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'])]
+
+    def __str__(self):
+        return f"Ingestion of {self.document} ({self.status})"
+
+class DocumentViewBucket(models.Model):
+    """
+    Views of a document in one time bucket, for view rates. Written in
+    batches by documents.counters, never per request.
+    """
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='view_buckets'
+    )
+    start = models.DateTimeField(db_index=True)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['document', 'start'], name='unique_view_bucket')]
+
+    def __str__(self):
+        return f"{self.count} view(s) of {self.document} from {self.start}"
+
+class SearchDocument(models.Model):
+    """
+    A document's entry in the keyword index: its BM25 length and the terms
+    it was indexed under, so its postings can be found again on reindex.
+    """
+    # Left in place when the document is deleted: the indexer needs the
+    # terms to find the postings it has to remove.
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name='search_entry'
+    )
+    length = models.FloatField(default=0)  # Field-weighted number of terms
+    terms = models.TextField(blank=True)  # Space separated
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Index entry of {self.document}"
+
+class SearchPosting(models.Model):
+    """
+    Packed postings of one term for one block of document ids. Splitting by
+    block keeps each row small, so indexing a document rewrites kilobytes
+    instead of a frequent term's whole postings list.
+    """
+    term = models.CharField(max_length=64)
+    block = models.PositiveIntegerField()
+    postings = models.BinaryField()  # See documents.search.keyword.POSTING
+    # Number of postings, so document frequencies are summed without
+    # unpacking the blobs
+    document_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['term', 'block'], name='unique_search_posting')]
+
+    def __str__(self):
+        return f"{self.term} [{self.block}]"
+
+class DocumentEmbedding(models.Model):
+    """
+    A document's vector for semantic search. These rows are the source of
+    truth; the memory-mapped index files are snapshots built from them.
+    """
+    document = models.OneToOneField(
+        Document,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='embedding'
+    )
+    model = models.CharField(max_length=100)  # Encoder that produced the vector
+    vector = models.BinaryField()  # float32, L2-normalised
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Embedding of {self.document} ({self.model})"
+
+class AutoKeyword(models.Model):
+    """
+    A keyword found in a document by keyword extraction. Kept apart from
+    the owner's tags: taggit's Tag table is shared by all users, and these
+    come from the document's (possibly private) text.
+    """
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='auto_keywords'
+    )
+    name = models.CharField(max_length=100)
+    score = models.FloatField()  # TF-IDF weight when extracted
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [models.UniqueConstraint(fields=['document', 'name'], name='unique_auto_keyword_name')]
+
+    def __str__(self):
+        return f"{self.name} on {self.document}"
+
+class IndexChange(models.Model):
+    """
+    Durable log of changes that search indexes have to apply. Rows are
+    written by the signal handlers in documents.signals and consumed in id
+    order by the run_indexer command.
+    """
+    ACTIONS = (
+        ('index', 'Index'),
+        ('delete', 'Delete'),
+        ('grant', 'Grant'),
+        ('revoke', 'Revoke'),
+    )
+
+    # Not foreign keys: the log has to outlive deleted documents and users
+    document_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)  # Owner, or grantee for grants
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    fields = models.CharField(max_length=255, blank=True)  # Comma separated, empty when unknown
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.action} document {self.document_id}"
+
+class IndexerState(models.Model):
+    """Watermark of an index consumer: the last change it has applied."""
+    name = models.CharField(max_length=50, unique=True)
+    last_change_id = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at change {self.last_change_id}"
+
+class DocumentGrant(models.Model):
+    """Access to one restricted or private document for one user."""
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='grants'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_grants'
+    )
+    granted_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'document'], name='unique_document_grant')]
+
+    def __str__(self):
+        return f"{self.user} may view {self.document}"
+
 class AccessRequest(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending Approval'),
@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+COUNT_TIMEOUT = 300  # Seconds an approximate total is cached
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode(token):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, values, offset = data
+        if direction not in ('n', 'p') or not isinstance(values, list) or not isinstance(offset, int):
+            return None
+        return direction, values, max(offset, 0)
+    except (ValueError, TypeError):
+        return None
+
+
+def _count_version_key(model):
+    return f'keyset-count-version:{model._meta.db_table}'
+
+
+def expire_counts(model):
+    """Drop the cached totals of a table; called when its rows change."""
+    try:
+        cache.incr(_count_version_key(model))
+    except ValueError:
+        cache.set(_count_version_key(model), 1, None)
+
+
+def approximate_count(queryset, timeout=COUNT_TIMEOUT):
+    """
+    A total for display. Unfiltered PostgreSQL tables use the planner's
+    estimate; anything else is counted once and cached for ``timeout``, or
+    until expire_counts() is called for the table. Caches are per process
+    unless CACHES says otherwise, so the total may still lag a little.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return int(row[0])
+    version = cache.get(_count_version_key(queryset.model), 0)
+    key = f'keyset-count:{version}:' + hashlib.md5(str(queryset.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a queryset ordered by ``ordering``, whose last
+    field must be unique (normally the primary key). Pages are fetched with
+    a WHERE on the previous page's last row instead of an OFFSET, so deep
+    pages cost the same as the first one.
+
+    Page "numbers" are opaque tokens, so templates written for Django's
+    Paginator keep working: ``?page={{ page.next_page_number }}``.
+
+    The total comes from approximate_count(), so paging does not run a
+    COUNT per page; templates show it as "about N". ``approximate=False``
+    counts exactly, for small querysets only.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pk',), approximate=True, count_timeout=COUNT_TIMEOUT):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+        self.approximate = approximate
+        self.count_timeout = count_timeout
+
+    @cached_property
+    def count(self):
+        if self.approximate:
+            return approximate_count(self.queryset, self.count_timeout)
+        return self.queryset.count()
+
+    @property
+    def page_range(self):
+        # Pages cannot be addressed by number
+        return range(0)
+
+    def _key(self, obj):
+        return [self._field(name).value_to_string(obj) for name, _ in self.ordering]
+
+    def _field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def _after(self, values, backwards):
+        """Q for rows after (or before) the row with the given key."""
+        values = [self._field(name).to_python(value) for (name, _), value in zip(self.ordering, values)]
+        condition = Q()
+        for position in reversed(range(len(self.ordering))):
+            name, descending = self.ordering[position]
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            if position < len(self.ordering) - 1:
+                step |= Q(**{name: values[position]}) & condition
+            condition = step
+        return condition
+
+    def page(self, token=None):
+        cursor = _decode(token) if token else None
+        condition = None
+        if cursor is not None and len(cursor[1]) == len(self.ordering):
+            try:
+                condition = self._after(cursor[1], backwards=cursor[0] == 'p')
+            except (ValidationError, ValueError, TypeError):
+                # A malformed key, e.g. edited by hand; start over
+                condition = None
+
+        if condition is None:
+            rows = list(self.queryset[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            return KeysetPage(self, rows[:self.per_page], 0, has_previous=False, has_next=more)
+
+        direction, _, offset = cursor
+        if direction == 'n':
+            rows = list(self.queryset.filter(condition)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            return KeysetPage(self, rows[:self.per_page], offset, has_previous=True, has_next=more)
+
+        reverse = [f'{"" if descending else "-"}{name}' for name, descending in self.ordering]
+        rows = list(self.queryset.filter(condition).order_by(*reverse)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(self, rows, offset if more else 0, has_previous=more, has_next=True)
+
+
+class KeysetPage:
+    """The parts of django.core.paginator.Page that templates use."""
+
+    def __init__(self, paginator, object_list, offset, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.offset = offset
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def number(self):
+        return self.offset // self.paginator.per_page + 1
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        last = self.object_list[-1]
+        return _encode(['n', self.paginator._key(last), self.offset + len(self.object_list)])
+
+    def previous_page_number(self):
+        first = self.object_list[0]
+        return _encode(['p', self.paginator._key(first), max(self.offset - self.paginator.per_page, 0)])
+
+    def start_index(self):
+        return self.offset + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.offset + len(self.object_list)
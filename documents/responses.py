@@ -0,0 +1,80 @@
+import mimetypes
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .encryption import open_encrypted
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into a half-open (start, end) pair.
+    Returns None when the header should be ignored (absent, malformed or
+    asking for several ranges) and raises ValueError when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range.")
+        return max(size - length, 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError("Range not satisfiable.")
+    return start, end
+
+
+def guess_content_type(document):
+    # The stored file is a content-addressed blob without an extension;
+    # the uploaded file name has it
+    name = (document.file_name or '').lower()
+    mime_type, _ = mimetypes.guess_type(name)
+    if not mime_type:
+        mime_type = 'application/octet-stream'
+    elif name.endswith('.csv'):
+        mime_type = 'text/csv'
+    return mime_type
+
+
+def _stream(reader, start, end):
+    # Closing the generator (client went away) closes the file as well.
+    try:
+        yield from reader.iter_range(start, end)
+    finally:
+        reader.close()
+
+
+def encrypted_file_response(request, document, as_attachment=False):
+    """
+    Stream a document's decrypted content, honouring a ``Range`` header with
+    a 206 response. Only the segments overlapping the range are decrypted.
+    """
+    reader = open_encrypted(document.file.path, document.data_key)
+    size = reader.size
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except ValueError:
+        reader.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size)
+    response = StreamingHttpResponse(_stream(reader, start, end), content_type=guess_content_type(document))
+    if byte_range:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+    response['Content-Length'] = str(end - start)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(as_attachment, document.title)
+    return response
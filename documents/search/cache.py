@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from documents.models import IndexChange, IndexerState
+
+from .text import analyze
+
+logger = logging.getLogger(__name__)
+
+# Search and chat rankings are cached per process (BACKEND 'memory') or in a
+# directory shared by the processes of one host (BACKEND 'file'). A key is
+# made of the normalized query, what kind of ranking it is, the filters and
+# a fingerprint of the user's personal document ids, so users with the same
+# access share entries. Every key also carries the index generation: the
+# newest document change and whether the indexer has applied it, so a
+# change to any document (or a grant, through the fingerprint) makes the
+# old entries unreachable. Entries are dropped least recently used first
+# once the cache is over its size bound.
+DEFAULTS = {
+    'BACKEND': 'memory',
+    'MAX_SIZE_MB': 64,
+    'DIRECTORY': None,
+    'REFRESH_INTERVAL': 1.0,
+}
+
+
+def config():
+    options = dict(DEFAULTS)
+    options.update(getattr(settings, 'SEARCH_RESULT_CACHE', {}))
+    if options['DIRECTORY'] is None:
+        options['DIRECTORY'] = os.path.join(settings.BASE_DIR, 'cache', 'results')
+    return options
+
+
+def normalize_query(query, analyzed=False):
+    """
+    Queries that give the same ranking should give the same key: keyword
+    rankings only depend on the set of index terms, the others on the text
+    up to case and spacing.
+    """
+    if analyzed:
+        return ' '.join(sorted(set(analyze(query))))
+    return ' '.join(query.casefold().split())
+
+
+def visibility_fingerprint(visibility):
+    """
+    Users who see the same documents get the same fingerprint: the same
+    personal ids and the same visible access levels.
+    """
+    if visibility is None:
+        return ''
+    if visibility.everything:
+        return 'all'
+    digest = hashlib.sha1(visibility.personal.tobytes())
+    digest.update(','.join(visibility.levels).encode())
+    return digest.hexdigest()[:20]
+
+
+class MemoryBackend:
+    """Serialized entries in an in-process LRU mapping."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            old = self.data.pop(key, None)
+            self.size += len(value) - (len(old) if old is not None else 0)
+            self.data[key] = value
+            while self.size > self.max_bytes and self.data:
+                self.size -= len(self.data.popitem(last=False)[1])
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+
+    def usage(self):
+        with self.lock:
+            return len(self.data), self.size
+
+
+class FileBackend:
+    """
+    One file per entry. Reads touch the file, so the modification time
+    orders entries by last use across processes; the directory is pruned
+    to the size bound every PRUNE_INTERVAL seconds.
+    """
+    PRUNE_INTERVAL = 10.0
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.last_prune = 0.0
+        self.lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(value)
+        os.replace(temporary, path)
+        if time.monotonic() - self.last_prune > self.PRUNE_INTERVAL:
+            self.prune()
+
+    def _entries(self):
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def prune(self):
+        with self.lock:
+            self.last_prune = time.monotonic()
+            entries = sorted(self._entries())
+            size = sum(entry[1] for entry in entries)
+            for _, length, path in entries:
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= length
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def usage(self):
+        entries = self._entries()
+        return len(entries), sum(entry[1] for entry in entries)
+
+
+class ResultCache:
+    def __init__(self, options=None):
+        self.options = options
+        self.backend = None
+        self.lock = threading.Lock()
+        self.generation = None
+        self.last_refresh = 0.0
+        self.counts = {}  # namespace -> [hits, misses]
+        self.invalidations = 0
+
+    def _options(self):
+        return self.options or config()
+
+    def _backend(self):
+        if self.backend is None:
+            options = self._options()
+            max_bytes = options['MAX_SIZE_MB'] * 2**20
+            if options['BACKEND'] == 'file':
+                self.backend = FileBackend(options['DIRECTORY'], max_bytes)
+            elif options['BACKEND'] == 'memory':
+                self.backend = MemoryBackend(max_bytes)
+            else:
+                raise ValueError(f"Unknown result cache backend {options['BACKEND']!r}")
+        return self.backend
+
+    def current_generation(self):
+        """
+        The newest document change, and whether the search indexer has
+        applied it yet; polled at most every REFRESH_INTERVAL seconds.
+        Grants are left out: they change the visibility fingerprint instead.
+        """
+        with self.lock:
+            if time.monotonic() - self.last_refresh < self._options()['REFRESH_INTERVAL']:
+                return self.generation
+            self.last_refresh = time.monotonic()
+            latest = (
+                IndexChange.objects.filter(action__in=('index', 'delete'))
+                .order_by('-pk').values_list('pk', flat=True).first()
+            ) or 0
+            applied = IndexerState.objects.filter(name='search').values_list('last_change_id', flat=True).first() or 0
+            generation = f'{latest}:{int(applied >= latest)}'
+            changed = self.generation is not None and generation != self.generation
+            self.generation = generation
+        if changed:
+            self.invalidations += 1
+            self._backend().clear()
+        return generation
+
+    def key(self, namespace, parts, visibility=None, versioned=True):
+        generation = self.current_generation() if versioned else None
+        material = json.dumps(
+            [namespace, generation, visibility_fingerprint(visibility), parts],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _count(self, namespace, hit):
+        with self.lock:
+            self.counts.setdefault(namespace, [0, 0])[0 if hit else 1] += 1
+
+    def get_or_compute(self, namespace, parts, compute, visibility=None, versioned=True):
+        """
+        Return the cached value for ``parts`` (JSON serializable), or store
+        and return ``compute()``. None is never cached. Values that do not
+        depend on the documents pass ``versioned=False`` and skip the
+        generation check.
+        """
+        backend = self._backend()
+        try:
+            key = self.key(namespace, parts, visibility, versioned)
+            cached = backend.get(key)
+        except Exception:
+            logger.warning("Result cache lookup failed", exc_info=True)
+            return compute()
+        if cached is not None:
+            self._count(namespace, True)
+            return json.loads(cached)
+        self._count(namespace, False)
+        value = compute()
+        if value is not None:
+            try:
+                backend.set(key, json.dumps(value, separators=(',', ':')).encode())
+            except Exception:
+                logger.warning("Result cache store failed", exc_info=True)
+        return value
+
+    def ranking(self, namespace, query, parts, visibility, compute, analyzed=False):
+        """
+        A cached (document id, score) ranking. Entries are checked against
+        ``visibility`` again on the way out, so an entry can never show a
+        document that became invisible before its key changed.
+        """
+        parts = [normalize_query(query, analyzed), parts]
+        ranking = self.get_or_compute(namespace, parts, compute, visibility)
+        if not ranking or visibility is None or visibility.everything:
+            return [tuple(pair) for pair in ranking]
+        visible = visibility.contains([document_id for document_id, _ in ranking])
+        return [tuple(pair) for pair, keep in zip(ranking, visible) if keep]
+
+    def clear(self):
+        self._backend().clear()
+
+    def stats(self):
+        with self.lock:
+            counts = {namespace: list(values) for namespace, values in self.counts.items()}
+        entries, size = self._backend().usage()
+        hits = sum(values[0] for values in counts.values())
+        lookups = sum(sum(values) for values in counts.values())
+        return {
+            'backend': self._options()['BACKEND'],
+            'entries': entries,
+            'size_mb': round(size / 2**20, 2),
+            'hits': hits,
+            'misses': lookups - hits,
+            'hit_ratio': hits / lookups if lookups else None,
+            'invalidations': self.invalidations,
+            'namespaces': {
+                namespace: {
+                    'hits': values[0],
+                    'misses': values[1],
+                    'hit_ratio': values[0] / sum(values) if sum(values) else None,
+                }
+                for namespace, values in sorted(counts.items())
+            },
+        }
+
+
+result_cache = ResultCache()
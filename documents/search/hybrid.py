@@ -0,0 +1,88 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import connection
+
+from . import keyword, semantic
+from .ranking import top_k
+
+logger = logging.getLogger(__name__)
+
+# Hybrid search runs the semantic engine in a worker thread while the
+# keyword engine runs in the request thread, then fuses both rankings with
+# reciprocal-rank fusion. The semantic side only gets what is left of the
+# latency budget; if it has not answered by then the keyword ranking is
+# returned alone.
+DEFAULTS = {
+    'BUDGET_MS': 150,
+    'RRF_K': 60,
+    'KEYWORD_WEIGHT': 1.0,
+    'SEMANTIC_WEIGHT': 1.0,
+    'WORKERS': 4,
+}
+MAX_RESULTS = 1000
+
+_executor = None
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'HYBRID_SEARCH', {})}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config()['WORKERS'], thread_name_prefix='hybrid-search')
+    return _executor
+
+
+def _semantic_search(query, limit, candidates):
+    try:
+        return semantic.search(query, limit=limit, candidates=candidates)
+    finally:
+        # Pool threads would otherwise each keep a database connection open
+        connection.close()
+
+
+def fuse(rankings, weights, k):
+    """Reciprocal-rank fusion of (document id, score) lists."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, (document_id, _) in enumerate(ranking, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + weight / (k + rank)
+    return list(scores.items())
+
+
+def search(query, limit=MAX_RESULTS, candidates=None, budget=None):
+    """
+    Return up to ``limit`` (document id, fused score) pairs, best first.
+    ``budget`` (milliseconds, default HYBRID_SEARCH['BUDGET_MS']) bounds how
+    long the semantic engine may take.
+    """
+    options = config()
+    budget = options['BUDGET_MS'] if budget is None else budget
+    deadline = time.monotonic() + budget / 1000
+    semantic_future = _get_executor().submit(_semantic_search, query, limit, candidates)
+
+    keyword_ranking = keyword.search(query, limit=limit, candidates=candidates)
+    try:
+        semantic_ranking = semantic_future.result(timeout=max(deadline - time.monotonic(), 0))
+    except TimeoutError:
+        semantic_future.cancel()
+        logger.info("Semantic search missed the %sms budget; using keyword results only", budget)
+        return keyword_ranking
+    except Exception:
+        logger.warning("Semantic search failed; using keyword results only", exc_info=True)
+        return keyword_ranking
+
+    fused = fuse(
+        [keyword_ranking, semantic_ranking],
+        [options['KEYWORD_WEIGHT'], options['SEMANTIC_WEIGHT']],
+        options['RRF_K'],
+    )
+    if not fused:
+        return []
+    ids, scores = zip(*fused)
+    return top_k(ids, scores, limit)
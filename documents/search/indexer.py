@@ -0,0 +1,129 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import DEFERRED
+from django.utils import timezone
+
+from documents.models import Document, DocumentEmbedding, IndexChange, IndexerState
+
+from . import keyword, semantic
+
+logger = logging.getLogger(__name__)
+
+# Document fields the search indexes depend on; saves that change none of
+# them are not logged.
+INDEXED_FIELDS = ('title', 'description', 'access_level', 'semantic_indexing', 'owner_id')
+BATCH_SIZE = 500
+# Changes are only applied once they are this old, so a transaction that
+# took an id earlier but committed later is not skipped by the watermark.
+SETTLE_TIME = timedelta(seconds=2)
+RETENTION = timedelta(days=7)
+
+
+def record_change(document_id, action='index', fields=(), user_id=None):
+    IndexChange.objects.create(document_id=document_id, action=action, fields=','.join(fields), user_id=user_id)
+
+
+def record_changes(documents, action='index', fields=()):
+    """record_change for many (document id, owner id) pairs in bulk."""
+    IndexChange.objects.bulk_create(
+        [
+            IndexChange(document_id=document_id, action=action, fields=','.join(fields), user_id=user_id)
+            for document_id, user_id in documents
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def indexed_state(document):
+    # Deferred fields are left out rather than loaded one query at a time
+    return tuple(document.__dict__.get(field, DEFERRED) for field in INDEXED_FIELDS)
+
+
+def queue_document(document):
+    """Ingestion stage: have the indexer pick up the processed document."""
+    record_change(document.pk, user_id=document.owner_id)
+
+
+def pending_changes(after, limit):
+    """Settled changes after the ``after`` watermark, oldest first."""
+    settled = timezone.now() - SETTLE_TIME
+    return list(
+        IndexChange.objects.filter(pk__gt=after, created__lte=settled).order_by('pk')[:limit]
+    )
+
+
+def apply_changes(changes):
+    """
+    Apply a batch of changes to the keyword and vector indexes. Only the
+    last change per document counts, so the cost follows the number of
+    changed documents. Applying a batch twice is harmless, which makes
+    replaying after a crash safe.
+    """
+    latest = {}
+    for change in changes:
+        # Grants only concern the visibility index (documents.acl)
+        if change.action in ('index', 'delete'):
+            latest[change.document_id] = change.action
+    to_index = [document_id for document_id, action in latest.items() if action == 'index']
+
+    documents = list(
+        Document.objects.filter(pk__in=to_index).select_related('extracted_text', 'blob').prefetch_related('tags')
+    )
+    found = {document.pk for document in documents}
+    removed = [document_id for document_id in latest if document_id not in found]
+
+    keyword.remove_documents(removed)
+    keyword.index_documents(documents)
+    DocumentEmbedding.objects.filter(document_id__in=[
+        document.pk for document in documents if not document.semantic_indexing
+    ]).delete()
+    if semantic.embed_documents(documents) or removed:
+        semantic.maintain_snapshot(semantic.get_encoder().name)
+    return len(found), len(removed)
+
+
+def run_indexer(name='search', batch_size=BATCH_SIZE, poll_interval=1.0, stop=None, once=False,
+                apply=apply_changes):
+    """
+    Apply logged changes in batches, recording the watermark after each
+    batch, until ``stop`` is set (or the log is drained, with ``once``).
+    Other consumers of the log pass their own ``name`` and ``apply``; each
+    keeps its own watermark.
+    """
+    state, _ = IndexerState.objects.get_or_create(name=name)
+    last_prune = 0.0
+    while stop is None or not stop.is_set():
+        close_old_connections()
+        changes = pending_changes(state.last_change_id, batch_size)
+        if not changes:
+            if once:
+                return state
+            time.sleep(poll_interval)
+            continue
+        start = time.perf_counter()
+        indexed, removed = apply(changes)
+        state.last_change_id = changes[-1].pk
+        state.save(update_fields=['last_change_id', 'updated'])
+        logger.info("%s: applied %s change(s): %s indexed, %s removed in %.2fs",
+                    name, len(changes), indexed, removed, time.perf_counter() - start)
+        if time.monotonic() - last_prune > 3600:
+            prune_changes()
+            last_prune = time.monotonic()
+    return state
+
+
+def prune_changes():
+    """
+    Delete changes every consumer has applied and that are past retention,
+    keeping those the current semantic snapshot still reads.
+    """
+    watermark = min(IndexerState.objects.values_list('last_change_id', flat=True), default=0)
+    pinned = semantic.pinned_change_id()
+    if pinned is not None:
+        watermark = min(watermark, pinned)
+    retention = getattr(settings, 'SEARCH_CHANGE_LOG_RETENTION', RETENTION)
+    return IndexChange.objects.filter(pk__lte=watermark, created__lt=timezone.now() - retention).delete()[0]
@@ -0,0 +1,232 @@
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+
+from documents.models import ExtractedText, SearchDocument, SearchPosting
+
+from .ranking import top_k
+from .text import analyze
+
+# Postings are stored per (term, block of document ids) as packed records
+# sorted by document id. The document length is kept next to the term
+# frequency so scoring never has to look documents up.
+POSTING = np.dtype([('doc', '<i4'), ('tf', '<f4'), ('length', '<f4')])
+BLOCK_SIZE = 4096
+
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'tags': 2.0,
+    'description': 1.0,
+    'text': 1.0,
+}
+K1 = 1.2
+B = 0.75
+MAX_RESULTS = 1000
+STATS_TTL = 30  # Seconds the corpus size and average length are cached
+QUERY_CHUNK = 500  # Keeps IN lists below SQLite's variable limit
+
+_stats = {'expires': 0.0, 'count': 0, 'average_length': 0.0}
+_stats_lock = threading.Lock()
+
+
+def block_of(document_id):
+    return document_id // BLOCK_SIZE
+
+
+def _chunks(items, size=QUERY_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def document_fields(document):
+    """The indexed text of a document, by field."""
+    fields = {
+        'title': document.title,
+        'tags': ' '.join(tag.name for tag in document.tags.all()),
+        'description': document.description,
+        'text': '',
+    }
+    try:
+        fields['text'] = document.extracted_text.text
+    except ExtractedText.DoesNotExist:
+        pass
+    return fields
+
+
+def document_terms(document):
+    """Return a Counter of term -> field-weighted frequency."""
+    counts = Counter()
+    for field, text in document_fields(document).items():
+        weight = FIELD_WEIGHTS[field]
+        for term in analyze(text or ''):
+            counts[term] += weight
+    return counts
+
+
+def _update(entries):
+    """
+    Apply new term counts (or None for removal) for a batch of documents.
+    Each affected postings row is read and written once per batch.
+    """
+    if not entries:
+        return
+    old_terms = dict(
+        SearchDocument.objects.filter(pk__in=list(entries)).values_list('document_id', 'terms')
+    )
+
+    # (term, block) -> postings to add, and block -> documents to drop
+    added = defaultdict(list)
+    touched = defaultdict(set)
+    for document_id, counts in entries.items():
+        block = block_of(document_id)
+        for term in old_terms.get(document_id, '').split():
+            touched[block].add(term)
+        if counts:
+            length = sum(counts.values())
+            for term, tf in counts.items():
+                added[(term, block)].append((document_id, tf, length))
+                touched[block].add(term)
+    replaced = defaultdict(list)
+    for document_id in entries:
+        replaced[block_of(document_id)].append(document_id)
+
+    with transaction.atomic():
+        rows = {}
+        for block, terms in touched.items():
+            for chunk in _chunks(terms):
+                for row in SearchPosting.objects.select_for_update().filter(block=block, term__in=chunk):
+                    rows[(row.term, block)] = row
+
+        to_create, to_update, to_delete = [], [], []
+        for block, terms in touched.items():
+            drop = np.array(replaced[block], dtype='<i4')
+            for term in terms:
+                row = rows.get((term, block))
+                postings = np.frombuffer(row.postings, POSTING) if row else np.empty(0, POSTING)
+                postings = postings[~np.isin(postings['doc'], drop)]
+                if (term, block) in added:
+                    postings = np.concatenate([postings, np.array(added[(term, block)], POSTING)])
+                    postings.sort(order='doc')
+                if row is None:
+                    if len(postings):
+                        to_create.append(SearchPosting(
+                            term=term, block=block, postings=postings.tobytes(), document_count=len(postings)
+                        ))
+                elif len(postings):
+                    row.postings = postings.tobytes()
+                    row.document_count = len(postings)
+                    to_update.append(row)
+                else:
+                    to_delete.append(row.pk)
+
+        SearchPosting.objects.bulk_create(to_create, batch_size=QUERY_CHUNK)
+        SearchPosting.objects.bulk_update(to_update, ['postings', 'document_count'], batch_size=QUERY_CHUNK)
+        for chunk in _chunks(to_delete):
+            SearchPosting.objects.filter(pk__in=chunk).delete()
+
+        removed = [document_id for document_id, counts in entries.items() if counts is None]
+        SearchDocument.objects.filter(pk__in=removed).delete()
+        for document_id, counts in entries.items():
+            if counts is not None:
+                SearchDocument.objects.update_or_create(
+                    document_id=document_id,
+                    defaults={'length': sum(counts.values()), 'terms': ' '.join(counts)},
+                )
+
+
+def index_documents(documents):
+    """(Re)index a batch of documents."""
+    _update({document.pk: document_terms(document) for document in documents})
+
+
+def remove_documents(document_ids):
+    _update({document_id: None for document_id in document_ids})
+
+
+def index_document(document):
+    """Ingestion stage: add the document to the keyword index."""
+    index_documents([document])
+
+
+def corpus_stats():
+    """Return (document count, average length), cached for a short while."""
+    with _stats_lock:
+        if time.monotonic() < _stats['expires']:
+            return _stats['count'], _stats['average_length']
+    stats = SearchDocument.objects.aggregate(count=Count('pk'), average_length=Avg('length'))
+    count, average_length = stats['count'], stats['average_length'] or 0.0
+    if count:
+        with _stats_lock:
+            _stats.update(expires=time.monotonic() + STATS_TTL, count=count, average_length=average_length)
+    return count, average_length
+
+
+def document_frequencies(terms):
+    """Return a dict of term -> number of indexed documents containing it."""
+    frequencies = {}
+    for chunk in _chunks(set(terms)):
+        rows = (
+            SearchPosting.objects.filter(term__in=chunk)
+            .values('term').annotate(documents=Sum('document_count')).values_list('term', 'documents')
+        )
+        frequencies.update(rows)
+    return frequencies
+
+
+def search(query, limit=MAX_RESULTS, candidates=None):
+    """
+    Rank documents for ``query`` with BM25 and return up to ``limit``
+    (document id, score) pairs, best first. ``candidates`` (see
+    ranking.top_k) restricts the ranking to those documents.
+    """
+    terms = list(dict.fromkeys(analyze(query)))
+    if not terms:
+        return []
+    count, average_length = corpus_stats()
+    if not count:
+        return []
+
+    postings = defaultdict(list)
+    for chunk in _chunks(terms):
+        for term, data in SearchPosting.objects.filter(term__in=chunk).values_list('term', 'postings'):
+            postings[term].append(np.frombuffer(data, POSTING))
+    if not postings:
+        return []
+
+    documents, scores = [], []
+    for blocks in postings.values():
+        p = np.concatenate(blocks)
+        df = len(p)
+        idf = math.log(1 + (max(count, df) - df + 0.5) / (df + 0.5))
+        tf = p['tf']
+        norm = K1 * (1 - B + B * p['length'] / average_length)
+        documents.append(p['doc'])
+        scores.append(idf * tf * (K1 + 1) / (tf + norm))
+
+    # Scores are summed per document with a dense accumulator, which is
+    # linear in the number of postings instead of sorting them.
+    totals = np.bincount(np.concatenate(documents), weights=np.concatenate(scores))
+    ids = np.flatnonzero(totals)
+    return top_k(ids, totals[ids], limit, candidates)
+
+
+def index_queryset(documents, batch_size=500):
+    """Index every document of a queryset in batches; returns the count."""
+    total = 0
+    documents = documents.order_by('pk')
+    last = 0
+    while True:
+        batch = list(
+            documents.filter(pk__gt=last).select_related('extracted_text', 'blob').prefetch_related('tags')[:batch_size]
+        )
+        if not batch:
+            return total
+        index_documents(batch)
+        total += len(batch)
+        last = batch[-1].pk
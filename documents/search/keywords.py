@@ -0,0 +1,144 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from documents.models import AutoKeyword, Document, ExtractedText
+
+from . import keyword
+from .indexer import BATCH_SIZE
+from .text import MAX_TERM_LENGTH, STOPWORDS, stem, tokenize
+
+# Keywords are the terms of a document with the highest TF-IDF weight. The
+# document frequencies come from the keyword index, which is maintained
+# incrementally, so a batch costs one aggregate query instead of a pass
+# over the corpus. Keywords are stored per document (AutoKeyword), never as
+# taggit tags: the Tag table is shared by everyone, and keywords come from
+# the document's text, which may be private.
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'description': 1.0,
+    'text': 1.0,
+}
+MAX_KEYWORDS = 5
+MIN_LENGTH = 3  # Shorter terms make poor keywords
+MAX_KEYWORD_LENGTH = 100  # AutoKeyword.name
+# Titles are often file names
+IGNORED = STOPWORDS | frozenset('pdf doc docx txt csv xls xlsx ppt pptx'.split())
+
+
+def document_counts(document):
+    """
+    Return (Counter of term -> weighted frequency, dict of term -> the word
+    used most often for it), the latter giving readable keywords.
+    """
+    counts = Counter()
+    forms = defaultdict(Counter)
+    fields = {'title': document.title, 'description': document.description, 'text': ''}
+    try:
+        fields['text'] = document.extracted_text.text
+    except ExtractedText.DoesNotExist:
+        pass
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text or ''):
+            if len(token) < MIN_LENGTH or len(token) > MAX_TERM_LENGTH or token in IGNORED or token.isdigit():
+                continue
+            term = stem(token)
+            counts[term] += weight
+            forms[term][token] += 1
+    return counts, {term: words.most_common(1)[0][0] for term, words in forms.items()}
+
+
+def extract(documents, limit=MAX_KEYWORDS):
+    """
+    Return {document id: [(keyword, weight), ...]} for a batch of documents,
+    best first. The batch is scored as one sparse document-term matrix in
+    coordinate form.
+    """
+    documents = list(documents)
+    vocabulary = {}
+    rows, columns, frequencies, names = [], [], [], []
+    for row, document in enumerate(documents):
+        counts, forms = document_counts(document)
+        names.append(forms)
+        for term, frequency in counts.items():
+            rows.append(row)
+            columns.append(vocabulary.setdefault(term, len(vocabulary)))
+            frequencies.append(frequency)
+    result = {document.pk: [] for document in documents}
+    if not vocabulary:
+        return result
+    rows = np.array(rows, dtype=np.int64)
+    columns = np.array(columns, dtype=np.int64)
+    frequencies = np.array(frequencies, dtype=np.float64)
+
+    # Documents of this batch may not be in the index yet; count them too
+    indexed = keyword.document_frequencies(vocabulary)
+    df = np.array([indexed.get(term, 0) for term in vocabulary], dtype=np.float64)
+    df = np.maximum(df, np.bincount(columns, minlength=len(vocabulary)))
+    count = max(keyword.corpus_stats()[0], len(documents))
+    idf = np.log((1 + count) / (1 + df)) + 1
+
+    lengths = np.bincount(rows, weights=frequencies, minlength=len(documents))
+    weights = frequencies / lengths[rows] * idf[columns]
+
+    # Sort by document, then weight, and keep the first ``limit`` of each
+    order = np.lexsort((-weights, rows))
+    rows, columns, weights = rows[order], columns[order], weights[order]
+    starts = np.searchsorted(rows, rows)
+    keep = np.arange(len(rows)) - starts < limit
+
+    terms = list(vocabulary)
+    for row, column, weight in zip(rows[keep].tolist(), columns[keep].tolist(), weights[keep].tolist()):
+        name = names[row][terms[column]][:MAX_KEYWORD_LENGTH]
+        result[documents[row].pk].append((name, weight))
+    return result
+
+
+def apply_keywords(document, keywords):
+    """Replace the document's keywords with ``keywords``; returns their names."""
+    wanted = dict(keywords)
+    with transaction.atomic():
+        AutoKeyword.objects.filter(document=document).exclude(name__in=list(wanted)).delete()
+        AutoKeyword.objects.bulk_create(
+            [AutoKeyword(document=document, name=name, score=score) for name, score in wanted.items()],
+            update_conflicts=True, unique_fields=['document', 'name'], update_fields=['score'],
+        )
+    return list(wanted)
+
+
+def extract_documents(documents, limit=MAX_KEYWORDS):
+    """
+    Extract and apply keywords for a batch of documents. Documents that opted
+    out of extraction lose their keywords.
+    """
+    documents = list(documents)
+    enabled = [document for document in documents if document.auto_keyword_extraction]
+    keywords = extract(enabled, limit)
+    for document in documents:
+        apply_keywords(document, keywords.get(document.pk, []))
+    return len(enabled)
+
+
+def apply_keyword_changes(changes, limit=MAX_KEYWORDS):
+    """
+    Change log consumer (see indexer.run_indexer): extract keywords for
+    newly ingested documents. Ingestion logs its changes without fields;
+    edits are not picked up.
+    """
+    document_ids = {change.document_id for change in changes if change.action == 'index' and not change.fields}
+    documents = Document.objects.filter(pk__in=document_ids).select_related('extracted_text', 'blob')
+    return extract_documents(documents, limit), 0
+
+
+def extract_queryset(documents, batch_size=BATCH_SIZE, limit=MAX_KEYWORDS):
+    """Extract keywords for every document of a queryset in batches; returns the count."""
+    total, last = 0, 0
+    documents = documents.order_by('pk')
+    while True:
+        batch = list(documents.filter(pk__gt=last).select_related('extracted_text', 'blob')[:batch_size])
+        if not batch:
+            return total
+        total += extract_documents(batch, limit)
+        last = batch[-1].pk
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+def restrict(ids, scores, candidates):
+    if hasattr(candidates, 'contains'):
+        keep = candidates.contains(ids)
+    else:
+        keep = np.isin(ids, np.asarray(candidates, dtype=np.int64))
+    return ids[keep], scores[keep]
+
+
+def top_k(ids, scores, limit, candidates=None):
+    """
+    Return up to ``limit`` (document id, score) pairs with the highest
+    scores, best first and newer documents first among equal scores.
+    ``candidates`` restricts the result: an array of document ids, or a
+    documents.acl.Visibility.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    scores = np.asarray(scores)
+    if candidates is not None:
+        ids, scores = restrict(ids, scores, candidates)
+    if len(ids) > limit:
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        ids, scores = ids[top], scores[top]
+    order = np.lexsort((-ids, -scores))
+    return [(int(ids[i]), float(scores[i])) for i in order]
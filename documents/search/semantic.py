@@ -0,0 +1,462 @@
+import base64
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from chat.inference import InferenceClient, InferenceUnavailable
+from documents.model_registry import registry
+from documents.models import DocumentEmbedding, ExtractedText, IndexChange, IndexerState
+
+from .ranking import top_k
+from .text import analyze
+
+logger = logging.getLogger(__name__)
+
+# Semantic search runs entirely on the CPU. Document vectors live in the
+# DocumentEmbedding table; build_semantic_index and run_indexer write them to
+# a memory-mapped snapshot, and vectors changed since the snapshot are read
+# from the database at query time, so new uploads are searchable before the
+# next build. Documents deleted or taken out of semantic search since the
+# build are found through the IndexChange log, which is not pruned past the
+# snapshot, and left out of the snapshot's results. Until a first snapshot
+# exists semantic search finds nothing.
+# Queries are embedded by the inference server (chat.inference), which owns
+# the transformer model, so web workers never load torch; only the batch
+# processes (run_indexer, build_semantic_index) load it themselves.
+DEFAULTS = {
+    'BACKEND': 'auto',  # 'transformers', 'hashing', or 'auto' to fall back to hashing
+    'MODEL': 'sentence-transformers/all-MiniLM-L6-v2',
+    'DIMENSIONS': 384,  # Hashing backend only
+    'DTYPE': 'float32',  # float16 halves the snapshot; best combined with IVF
+    'MAX_CHARS': 4000,  # Text embedded per document
+    'BATCH_SIZE': 32,
+    'IVF_THRESHOLD': 50_000,  # Snapshots this large get an inverted file index
+    'IVF_PROBES': 16,
+    'MIN_SCORE': 0.0,  # Cosine similarity a result must exceed
+    'REBUILD_INTERVAL': 86400,  # Seconds before run_indexer writes a fresh snapshot
+}
+MAX_RESULTS = 1000
+DELTA_TTL = 5  # Seconds the post-snapshot vectors are cached per process
+SCAN_CHUNK = 65536
+
+_hashing_encoder = None
+_snapshots = {}
+_deltas = {}
+
+
+def config():
+    options = dict(DEFAULTS)
+    options['CACHE_DIR'] = os.path.join(settings.BASE_DIR, 'cache', 'transformers')
+    options['INDEX_DIR'] = os.path.join(settings.BASE_DIR, 'index', 'semantic')
+    options.update(getattr(settings, 'SEMANTIC_SEARCH', {}))
+    return options
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEncoder:
+    """
+    Signed feature hashing of stemmed terms and bigrams. It needs nothing
+    but numpy and catches shared vocabulary rather than meaning; it is the
+    fallback when PyTorch or the model files are not available.
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self.name = f'hashing-{dimensions}'
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = analyze(text)
+            features = terms + [f'{a} {b}' for a, b in zip(terms, terms[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            counts = np.bincount(hashes % self.dimensions, weights=signs, minlength=self.dimensions)
+            vectors[row] = np.sign(counts) * np.log1p(np.abs(counts))
+        return normalize(vectors)
+
+
+class TransformerEncoder:
+    """Mean-pooled sentence embeddings from a Hugging Face model, on the CPU."""
+
+    def __init__(self, model_name, cache_dir):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+        self.model = AutoModel.from_pretrained(model_name, cache_dir=cache_dir).eval()
+
+    def encode(self, texts):
+        with self.torch.inference_mode():
+            batch = self.tokenizer(texts, padding=True, truncation=True, max_length=256, return_tensors='pt')
+            output = self.model(**batch).last_hidden_state
+            mask = batch['attention_mask'].unsqueeze(-1).to(output.dtype)
+            pooled = (output * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+        return normalize(pooled.numpy().astype(np.float32))
+
+
+def load_transformer_encoder():
+    """Model registry loader (see documents.model_registry)."""
+    options = config()
+    return TransformerEncoder(options['MODEL'], options['CACHE_DIR'])
+
+
+def hashing_encoder():
+    global _hashing_encoder
+    if _hashing_encoder is None:
+        _hashing_encoder = HashingEncoder(config()['DIMENSIONS'])
+    return _hashing_encoder
+
+
+def get_encoder():
+    """
+    The encoder for embedding documents in this process. The transformer
+    model is held by the model registry, which may unload it to stay within
+    its memory budget. In 'auto' mode a failure falls back to hashing for
+    this call only, so the model is tried again next time.
+    """
+    options = config()
+    if options['BACKEND'] in ('transformers', 'auto'):
+        try:
+            return registry.get('embedding')
+        except Exception:
+            if options['BACKEND'] == 'transformers':
+                raise
+            logger.warning("Semantic search falls back to the hashing encoder", exc_info=True)
+    return hashing_encoder()
+
+
+def embed_query(query):
+    """
+    Return (model name, vector) for a search query, embedded by the
+    inference server. In 'auto' mode the hashing encoder answers while the
+    server is down or still loading, without being remembered.
+    """
+    options = config()
+    if options['BACKEND'] in ('transformers', 'auto'):
+        try:
+            model_name, vectors = InferenceClient().embed([query])
+            return model_name, np.frombuffer(base64.b64decode(vectors[0]), dtype=np.float32)
+        except InferenceUnavailable as e:
+            if options['BACKEND'] == 'transformers':
+                raise
+            logger.warning("Query embedding falls back to the hashing encoder: %s", e)
+    encoder = hashing_encoder()
+    return encoder.name, encoder.encode([query])[0]
+
+
+def document_text(document, max_chars):
+    parts = [document.title, ' '.join(tag.name for tag in document.tags.all()), document.description]
+    try:
+        parts.append(document.extracted_text.text[:max_chars])
+    except ExtractedText.DoesNotExist:
+        pass
+    return '\n'.join(part for part in parts if part)[:max_chars]
+
+
+def embed_documents(documents):
+    """Compute and store embeddings for a batch of documents."""
+    options = config()
+    encoder = get_encoder()
+    documents = [document for document in documents if document.semantic_indexing]
+    for start in range(0, len(documents), options['BATCH_SIZE']):
+        batch = documents[start:start + options['BATCH_SIZE']]
+        vectors = encoder.encode([document_text(document, options['MAX_CHARS']) for document in batch])
+        for document, vector in zip(batch, vectors):
+            DocumentEmbedding.objects.update_or_create(
+                document=document,
+                defaults={'model': encoder.name, 'vector': vector.astype(np.float32).tobytes()},
+            )
+    return len(documents)
+
+
+def embed_document(document):
+    """Ingestion stage: embed the document unless semantic indexing is off."""
+    if document.semantic_indexing:
+        embed_documents([document])
+    else:
+        DocumentEmbedding.objects.filter(document=document).delete()
+
+
+def _model_dir(model_name):
+    return os.path.join(config()['INDEX_DIR'], model_name.replace('/', '--'))
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped set of vectors. Large snapshots are sorted by
+    IVF list so a query only scans the lists closest to it.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.path = path
+        # Empty arrays cannot be memory-mapped
+        mmap_mode = 'r' if self.meta['count'] else None
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode=mmap_mode)
+        self.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+        self.centroids = self.offsets = None
+        if self.meta['lists']:
+            self.centroids = np.load(os.path.join(path, 'centroids.npy'))
+            self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+
+    @property
+    def built_at(self):
+        return datetime.fromisoformat(self.meta['built_at'])
+
+    def _scan(self, start, end, query):
+        scores = np.empty(end - start, dtype=np.float32)
+        for offset in range(start, end, SCAN_CHUNK):
+            chunk = self.vectors[offset:min(offset + SCAN_CHUNK, end)]
+            scores[offset - start:offset - start + len(chunk)] = chunk.astype(np.float32, copy=False) @ query
+        return scores
+
+    def search(self, query, probes):
+        if self.centroids is None:
+            return np.asarray(self.ids), self._scan(0, len(self.ids), query)
+        probes = min(probes, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        ids, scores = [], []
+        for number in nearest:
+            start, end = int(self.offsets[number]), int(self.offsets[number + 1])
+            ids.append(self.ids[start:end])
+            scores.append(self._scan(start, end, query))
+        return np.concatenate(ids), np.concatenate(scores)
+
+
+def current_snapshot(model_name):
+    """The latest snapshot for a model, reloaded when a new one is built."""
+    pointer = os.path.join(_model_dir(model_name), 'CURRENT')
+    try:
+        mtime = os.stat(pointer).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _snapshots.get(model_name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(pointer) as f:
+        snapshot = Snapshot(os.path.join(_model_dir(model_name), f.read().strip()))
+    _snapshots[model_name] = (mtime, snapshot)
+    return snapshot
+
+
+def maintain_snapshot(model_name):
+    """
+    Called by run_indexer: write the first snapshot of a model once it has
+    vectors, and a fresh one every REBUILD_INTERVAL so the delta and the
+    change log it pins stay short. Returns the new snapshot, if any.
+    """
+    snapshot = current_snapshot(model_name)
+    if snapshot is not None:
+        if (timezone.now() - snapshot.built_at).total_seconds() < config()['REBUILD_INTERVAL']:
+            return None
+    elif not DocumentEmbedding.objects.filter(model=model_name).exists():
+        return None
+    logger.info("Writing a semantic snapshot for %s", model_name)
+    return build_snapshot(model_name)
+
+
+def pinned_change_id():
+    """
+    The oldest change a current snapshot still needs from the log (see
+    _removed), or None. Only snapshots of the configured models count.
+    """
+    options = config()
+    pinned = []
+    for model_name in (options['MODEL'], HashingEncoder(options['DIMENSIONS']).name):
+        snapshot = current_snapshot(model_name)
+        if snapshot is not None:
+            pinned.append(snapshot.meta.get('change_id', 0))
+    return min(pinned, default=None)
+
+
+def _removed(model_name, snapshot):
+    """
+    Ids in the snapshot whose vector has since been deleted: the document
+    was deleted or semantic indexing was turned off. Read from the changes
+    the indexer had not applied when the snapshot was built; the log is
+    kept from there on (see pinned_change_id).
+    """
+    touched = set(
+        IndexChange.objects.filter(pk__gt=snapshot.meta.get('change_id', 0), action__in=('index', 'delete'))
+        .values_list('document_id', flat=True).distinct()
+    )
+    if not touched:
+        return np.array([], dtype=np.int64)
+    present = set(
+        DocumentEmbedding.objects.filter(model=model_name, document_id__in=touched)
+        .values_list('document_id', flat=True)
+    )
+    return np.array(sorted(touched - present), dtype=np.int64)
+
+
+def _delta(model_name, snapshot):
+    """
+    Vectors stored or changed since the snapshot was built, and the ids
+    whose vectors were removed since.
+    """
+    cached = _deltas.get(model_name)
+    if cached and cached[1] == snapshot.path and time.monotonic() < cached[0]:
+        return cached[2], cached[3], cached[4]
+    rows = DocumentEmbedding.objects.filter(model=model_name, updated__gte=snapshot.built_at)
+    removed = _removed(model_name, snapshot)
+    ids, vectors = [], []
+    for document_id, vector in rows.values_list('document_id', 'vector').iterator():
+        ids.append(document_id)
+        vectors.append(np.frombuffer(vector, dtype=np.float32))
+    ids = np.array(ids, dtype=np.int64)
+    vectors = np.vstack(vectors) if vectors else None
+    _deltas[model_name] = (time.monotonic() + DELTA_TTL, snapshot.path, ids, vectors, removed)
+    return ids, vectors, removed
+
+
+def search(query, limit=MAX_RESULTS, candidates=None):
+    """
+    Return up to ``limit`` (document id, cosine similarity) pairs for
+    ``query``, best first, optionally restricted to ``candidates``.
+    """
+    if not query.strip():
+        return []
+    model_name, vector = embed_query(query)
+    if not vector.any():
+        return []
+    snapshot = current_snapshot(model_name)
+    if snapshot is None:
+        # Written by run_indexer or build_semantic_index, never by a request
+        logger.info("No semantic snapshot for %s yet", model_name)
+        return []
+    delta_ids, delta_vectors, removed = _delta(model_name, snapshot)
+
+    snapshot_ids, snapshot_scores = snapshot.search(vector, config()['IVF_PROBES'])
+    # Vectors that changed after the build are scored from the database,
+    # and those removed since are dropped
+    stale = np.isin(snapshot_ids, np.concatenate([delta_ids, removed]))
+    ids, scores = [snapshot_ids[~stale]], [snapshot_scores[~stale]]
+    if delta_vectors is not None:
+        ids.append(delta_ids)
+        scores.append(delta_vectors @ vector)
+    ids, scores = np.concatenate(ids), np.concatenate(scores)
+    relevant = scores > config()['MIN_SCORE']
+    return top_k(ids[relevant], scores[relevant], limit, candidates)
+
+
+def train_ivf(vectors, lists, iterations=10, sample_size=None):
+    """Spherical k-means on a sample; returns normalised centroids."""
+    rng = np.random.default_rng(0)
+    sample_size = min(len(vectors), sample_size or lists * 64)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        present, starts = np.unique(assignment[order], return_index=True)
+        centroids[present] = np.add.reduceat(sample[order], starts, axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+def assign_lists(vectors, centroids):
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_CHUNK):
+        chunk = np.asarray(vectors[start:start + SCAN_CHUNK], dtype=np.float32)
+        assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def build_snapshot(model_name=None, keep=2):
+    """
+    Write the stored vectors of a model to a new snapshot directory and
+    make it current. Returns the snapshot.
+    """
+    options = config()
+    model_name = model_name or get_encoder().name
+    rows = DocumentEmbedding.objects.filter(model=model_name)
+    # Taken before reading, so anything written during the build is
+    # still picked up from the database as part of the delta; likewise
+    # removals not yet applied by the indexer are looked for after change_id.
+    built_at = timezone.now()
+    change_id = IndexerState.objects.filter(name='search').values_list('last_change_id', flat=True).first() or 0
+    count = rows.count()
+
+    root = _model_dir(model_name)
+    name = built_at.strftime('%Y%m%d%H%M%S%f')
+    path = os.path.join(root, name)
+    os.makedirs(path)
+
+    dtype = np.dtype(options['DTYPE'])
+    ids = np.empty(count, dtype=np.int64)
+    vectors = None
+    filled = 0
+    for document_id, vector in rows.order_by('pk').values_list('document_id', 'vector').iterator(chunk_size=2000):
+        if filled == count:
+            break
+        vector = np.frombuffer(vector, dtype=np.float32)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(path, 'unsorted.npy'), mode='w+', dtype=dtype, shape=(count, len(vector))
+            )
+        ids[filled] = document_id
+        vectors[filled] = vector
+        filled += 1
+    ids = ids[:filled]
+    if vectors is None:
+        vectors = np.zeros((0, options['DIMENSIONS']), dtype=dtype)
+    vectors = vectors[:filled]
+
+    lists = 0
+    if filled >= options['IVF_THRESHOLD']:
+        lists = int(np.sqrt(filled))
+        centroids = train_ivf(vectors, lists)
+        assignment = assign_lists(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+        np.save(os.path.join(path, 'centroids.npy'), centroids)
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        ids = ids[order]
+        ordered = np.lib.format.open_memmap(
+            os.path.join(path, 'vectors.npy'), mode='w+', dtype=dtype, shape=vectors.shape
+        )
+        for start in range(0, filled, SCAN_CHUNK):
+            ordered[start:start + SCAN_CHUNK] = vectors[order[start:start + SCAN_CHUNK]]
+        ordered.flush()
+        del vectors, ordered
+        os.remove(os.path.join(path, 'unsorted.npy'))
+    elif isinstance(vectors, np.memmap):
+        vectors.flush()
+        del vectors
+        os.replace(os.path.join(path, 'unsorted.npy'), os.path.join(path, 'vectors.npy'))
+    else:
+        np.save(os.path.join(path, 'vectors.npy'), vectors)
+    np.save(os.path.join(path, 'ids.npy'), ids)
+
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'model': model_name, 'built_at': built_at.isoformat(), 'count': int(filled),
+                   'dtype': dtype.name, 'lists': lists, 'change_id': change_id}, f)
+    # Readers follow CURRENT, which is switched atomically
+    pointer = os.path.join(root, 'CURRENT')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(name)
+    os.replace(pointer + '.tmp', pointer)
+
+    # Old snapshots can go; processes still mapping them keep their pages
+    versions = sorted(entry for entry in os.listdir(root) if entry.isdigit())
+    for old in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return Snapshot(path)
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from taggit.models import TaggedItem
+
+from documents.models import Document, IndexChange
+
+# Tag filters are answered from memory: every tag maps to a bitmap of the
+# ids of its documents, held as a Python int (bit n set = document n has
+# the tag). AND, OR and facet counts are then single big-integer
+# operations instead of one join per tag. Changes are applied to copies
+# that are then swapped in, so readers never take the lock.
+REFRESH_INTERVAL = 1.0  # Seconds between polls of the change log
+FACET_CANDIDATES = 200  # Most used tags that facets are counted for
+OVERLAP = timedelta(seconds=10)  # See documents.acl
+
+
+def bitmap_from_ids(ids):
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return 0
+    bits = np.zeros(int(ids.max()) + 1, dtype=bool)
+    bits[ids] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+def visible_bitmap(visibility):
+    """
+    Bitmap of the documents in a documents.acl.Visibility; None (all
+    documents) for users who see everything.
+    """
+    if visibility.everything:
+        return None
+    bitmap = int.from_bytes(np.packbits(visibility.open_mask, bitorder='little').tobytes(), 'little')
+    return bitmap | bitmap_from_ids(visibility.personal)
+
+
+def ids_from_bitmap(bitmap):
+    """Sorted numpy array of the ids set in a bitmap."""
+    if not bitmap:
+        return np.empty(0, dtype=np.int64)
+    data = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder='little')).astype(np.int64)
+
+
+class TagIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bitmaps = None
+        self.ranked = []  # The FACET_CANDIDATES most used tag names
+        self.document_tags = {}
+        self.since = None
+        self.last_refresh = 0.0
+
+    def _tagged_items(self):
+        content_type = ContentType.objects.get_for_model(Document)
+        return TaggedItem.objects.filter(content_type=content_type)
+
+    def _build(self):
+        now = timezone.now()
+        ids_by_tag = defaultdict(list)
+        document_tags = defaultdict(set)
+        for document_id, name in self._tagged_items().values_list('object_id', 'tag__name').iterator():
+            ids_by_tag[name].append(document_id)
+            document_tags[document_id].add(name)
+        bitmaps = {name: bitmap_from_ids(ids) for name, ids in ids_by_tag.items()}
+        self.ranked = _most_used(bitmaps)
+        self.bitmaps = bitmaps
+        self.document_tags = {document_id: frozenset(names) for document_id, names in document_tags.items()}
+        self.since = now
+
+    def _apply(self, document_ids):
+        current = defaultdict(set)
+        rows = self._tagged_items().filter(object_id__in=document_ids).values_list('object_id', 'tag__name')
+        for document_id, name in rows:
+            current[document_id].add(name)
+        bitmaps, document_tags = dict(self.bitmaps), dict(self.document_tags)
+        for document_id in document_ids:
+            old = document_tags.get(document_id, frozenset())
+            new = frozenset(current.get(document_id, ()))
+            bit = 1 << document_id
+            for name in new - old:
+                bitmaps[name] = bitmaps.get(name, 0) | bit
+            for name in old - new:
+                bitmap = bitmaps.get(name, 0) & ~bit
+                if bitmap:
+                    bitmaps[name] = bitmap
+                else:
+                    bitmaps.pop(name, None)
+            if new:
+                document_tags[document_id] = new
+            else:
+                document_tags.pop(document_id, None)
+        self.ranked = _most_used(bitmaps)
+        self.bitmaps, self.document_tags = bitmaps, document_tags
+
+    def refresh(self):
+        """Build on first use, then apply tag changes from the IndexChange log."""
+        with self.lock:
+            if self.bitmaps is None:
+                self._build()
+                self.last_refresh = time.monotonic()
+                return
+            if time.monotonic() - self.last_refresh < REFRESH_INTERVAL:
+                return
+            self.last_refresh = time.monotonic()
+            now = timezone.now()
+            changes = IndexChange.objects.filter(
+                created__gte=self.since - OVERLAP, action__in=('index', 'delete')
+            ).values_list('document_id', 'fields', 'action')
+            document_ids = {
+                document_id for document_id, fields, action in changes
+                if action == 'delete' or not fields or 'tags' in fields.split(',')
+            }
+            self.since = now
+            if document_ids:
+                self._apply(document_ids)
+
+    def match(self, tags, mode='and'):
+        """Bitmap of the documents having all (or, with mode='or', any) of ``tags``."""
+        self.refresh()
+        bitmaps = [self.bitmaps.get(tag, 0) for tag in tags]
+        if not bitmaps:
+            return 0
+        if mode == 'or':
+            result = 0
+            for bitmap in bitmaps:
+                result |= bitmap
+            return result
+        # Intersect the smallest bitmaps first; an empty one ends it early
+        bitmaps.sort(key=int.bit_count)
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not result:
+                break
+            result &= bitmap
+        return result
+
+    def document_ids(self, tags, mode='and'):
+        return ids_from_bitmap(self.match(tags, mode))
+
+    def facets(self, bitmap, limit=20):
+        """
+        The most frequent tags, with counts, among the documents of
+        ``bitmap``. None counts all tagged documents and is only meant for
+        users who may see everything (see visible_bitmap). Only the
+        FACET_CANDIDATES most used tags overall are counted.
+        """
+        self.refresh()
+        bitmaps = self.bitmaps
+        tagged = ((name, bitmaps.get(name, 0)) for name in self.ranked)
+        if bitmap is None:
+            counts = ((name, tags.bit_count()) for name, tags in tagged)
+        else:
+            counts = ((name, (tags & bitmap).bit_count()) for name, tags in tagged)
+        return sorted(((name, count) for name, count in counts if count), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def _most_used(bitmaps):
+    return sorted(bitmaps, key=lambda name: (-bitmaps[name].bit_count(), name))[:FACET_CANDIDATES]
+
+
+tag_index = TagIndex()
@@ -0,0 +1,69 @@
+import re
+
+# Tokenisation and stemming shared by indexing and querying, so both sides
+# always agree on the terms.
+TOKEN_RE = re.compile(r'[^\W_]+')
+MAX_TERM_LENGTH = 64
+
+STOPWORDS = frozenset('''
+a about above after again against all am an and any are as at be because been
+before being below between both but by can could did do does doing down during
+each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no
+nor not now of off on once only or other our ours ourselves out over own same
+she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours yourself
+yourselves find show me get give want need please document documents file files
+'''.split())
+
+VOWELS = set('aeiouy')
+
+
+def _has_vowel(word):
+    return any(c in VOWELS for c in word)
+
+
+def stem(word):
+    """
+    A light English suffix stripper. It is deliberately conservative: it
+    folds plurals, -ing/-ed forms and a few derivational suffixes so that
+    'reports', 'reporting' and 'reported' meet at 'report'.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix, replacement in (
+        ('ational', 'ate'), ('ization', 'ize'), ('fulness', 'ful'), ('iveness', 'ive'),
+        ('ousness', 'ous'), ('tional', 'tion'), ('ements', 'ement'), ('ments', 'ment'),
+    ):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'shes', 'ches', 'xes', 'zes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    for suffix in ('ingly', 'edly', 'ing', 'ed'):
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            if len(base) >= 3 and _has_vowel(base):
+                if len(base) > 3 and base[-1] == base[-2] and base[-1] not in 'lsz':
+                    base = base[:-1]
+                return base
+            break
+    if word.endswith('ly') and len(word) > 5:
+        return word[:-2]
+    return word
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def analyze(text, stopwords=STOPWORDS):
+    """Turn text into the list of index terms (lowercased, stopped, stemmed)."""
+    return [
+        stem(token) for token in tokenize(text)
+        if len(token) > 1 and token not in stopwords and len(token) <= MAX_TERM_LENGTH
+    ]
@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .blobs import release_blob
+from .models import Document, DocumentGrant
+from .pagination import expire_counts
+from .search.indexer import INDEXED_FIELDS, indexed_state, record_change
+
+
+@receiver(post_delete, sender=Document)
+def release_document_file(sender, instance, **kwargs):
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        # Documents stored before blobs existed own their file outright
+        storage, name = instance.file.storage, instance.file.name
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def expire_document_counts(sender, **kwargs):
+    expire_counts(Document)
+
+
+@receiver(post_init, sender=Document)
+def remember_indexed_state(sender, instance, **kwargs):
+    instance._indexed_state = indexed_state(instance)
+
+
+@receiver(post_save, sender=Document)
+def log_document_change(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        changed = INDEXED_FIELDS
+    else:
+        # View counts and status updates must not cost a reindex
+        old, new = instance._indexed_state, indexed_state(instance)
+        changed = [field for field, a, b in zip(INDEXED_FIELDS, old, new) if a != b]
+        if update_fields is not None:
+            changed = [field for field in changed if field.removesuffix('_id') in update_fields]
+    if changed:
+        record_change(instance.pk, fields=changed, user_id=instance.owner_id)
+        if 'owner_id' in changed and not created:
+            # The previous owner loses access too
+            previous_owner = instance._indexed_state[INDEXED_FIELDS.index('owner_id')]
+            if isinstance(previous_owner, int):
+                record_change(instance.pk, fields=['owner_id'], user_id=previous_owner)
+    instance._indexed_state = indexed_state(instance)
+
+
+@receiver(post_delete, sender=Document)
+def log_document_delete(sender, instance, **kwargs):
+    record_change(instance.pk, 'delete', user_id=instance.owner_id)
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def log_tag_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # taggit's through model is shared by every tagged model
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Document):
+        record_change(instance.pk, fields=['tags'], user_id=instance.owner_id)
+
+
+@receiver(post_save, sender=DocumentGrant)
+def log_grant(sender, instance, created, **kwargs):
+    if created:
+        record_change(instance.document_id, 'grant', user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=DocumentGrant)
+def log_revoke(sender, instance, **kwargs):
+    record_change(instance.document_id, 'revoke', user_id=instance.user_id)
@@ -0,0 +1,119 @@
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .blobs import content_hasher
+from .compression import codec_for
+from .encryption import SegmentWriter, SEGMENT_SIZE
+
+
+def upload_directory():
+    directory = os.path.join(settings.MEDIA_ROOT, 'documents')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+class EncryptedUploadedFile(UploadedFile):
+    """
+    An upload that was encrypted while it was received. ``size`` is the
+    plaintext size and ``digest`` its content hash; ``codec`` is the
+    compression applied before encryption. The ciphertext lives in a
+    temporary file next to its final location until ``move_to`` is called,
+    and is removed on close otherwise.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, encryption_key, digest, codec,
+                 content_type_extra=None):
+        super().__init__(open(path, 'rb'), name, content_type, size, charset, content_type_extra)
+        self.encryption_key = encryption_key
+        self.digest = digest
+        self.codec = codec
+        self.path = path
+        self.moved = False
+
+    def temporary_file_path(self):
+        return self.path
+
+    def move_to(self, path):
+        self.file.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.path, path)
+        self.path = path
+        self.moved = True
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            if not self.moved:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+
+class EncryptingUploadHandler(FileUploadHandler):
+    """
+    Encrypts the document upload chunk by chunk as it arrives and writes the
+    ciphertext straight to disk, so memory use per upload is bounded by the
+    segment size rather than the file size. Other file fields fall through to
+    the next handler.
+    """
+
+    chunk_size = SEGMENT_SIZE
+
+    def __init__(self, request=None, field_name='file'):
+        super().__init__(request)
+        self.target_field = field_name
+        self.active = False
+        self.temp_file = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name == self.target_field
+        if not self.active:
+            return
+        self.encryption_key = Fernet.generate_key()
+        self.temp_file = tempfile.NamedTemporaryFile(
+            dir=upload_directory(), prefix='upload_', suffix='.part', delete=False
+        )
+        self.writer = SegmentWriter(self.temp_file, self.encryption_key, codec=codec_for(self.file_name))
+        self.hasher = content_hasher()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.writer.write(raw_data)
+        self.hasher.update(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        self.writer.close()
+        self.temp_file.close()
+        return EncryptedUploadedFile(
+            self.temp_file.name,
+            self.file_name,
+            self.content_type,
+            self.writer.size,
+            self.charset,
+            self.encryption_key,
+            self.hasher.hexdigest(),
+            self.writer.codec,
+            self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        if self.temp_file is not None and self.active:
+            self.temp_file.close()
+            try:
+                os.remove(self.temp_file.name)
+            except FileNotFoundError:
+                pass
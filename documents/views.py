@@ -1,21 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseForbidden
+from django.db import transaction
+from django.http import HttpResponseForbidden
 from django.contrib import messages
-from .models import Document, AccessRequest
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from .models import Document, AccessRequest, DocumentGrant
 from .forms import DocumentForm, SearchForm, AccessRequestForm
-from cryptography.fernet import Fernet
-import os
-import mimetypes
+from .acl import can_view, visibility_for, visible_q
+from .blobs import acquire_blob
+from .counters import record_view
+from .ingestion import enqueue
+from .pagination import KeysetPaginator
+from .responses import encrypted_file_response
+from .search import hybrid, keyword, semantic
+from .search.cache import result_cache
+from .search.tags import bitmap_from_ids, tag_index, visible_bitmap
+from .upload_handlers import EncryptingUploadHandler
+import numpy as np
 from datetime import datetime
-from django.conf import settings
-from django.contrib.auth.models import Group, Permission
-from django.contrib.contenttypes.models import ContentType
 
+@csrf_exempt
 @login_required
 def upload_document(request):
+    # The upload handler has to be installed before anything reads
+    # request.POST, including the CSRF check, so it is done here and the
+    # CSRF protection is applied to the inner view instead.
+    request.upload_handlers.insert(0, EncryptingUploadHandler(request))
+    return _upload_document(request)
+
+@csrf_protect
+def _upload_document(request):
     if request.method == 'POST':
         form = DocumentForm(request.POST, request.FILES)
         if form.is_valid():
@@ -24,26 +39,21 @@ def upload_document(request):
             document.size = request.FILES['file'].size
             document.status = 'queued'
             
-            # Save encrypted file
-            key = Fernet.generate_key()
-            fernet = Fernet(key)
-            file_content = request.FILES['file'].read()
-            encrypted_content = fernet.encrypt(file_content)
-            
-            file_name = request.FILES['file'].name
-            encrypted_path = os.path.join('media/documents', f'encrypted_{document.owner.id}_{file_name}')
-            os.makedirs(os.path.dirname(encrypted_path), exist_ok=True)
-            with open(encrypted_path, 'wb') as f:
-                f.write(encrypted_content)
-            
-            document.file = f'documents/encrypted_{document.owner.id}_{file_name}'
-            document.encryption_key = key
-            document.is_encrypted = True
-            document.virus_scanned = True
-            document.audit_trail = True
-            document.status = 'completed'
-            document.save()
-            form.save_m2m()  # Save tags
+            # The file was encrypted as it was received; store it in the blob
+            # shared by every upload with the same content and leave the rest
+            # of the processing to the ingestion workers
+            uploaded_file = request.FILES['file']
+            with transaction.atomic():
+                blob = acquire_blob(uploaded_file)
+                document.blob = blob
+                document.file = blob.file.name
+                document.file_name = uploaded_file.name
+                document.is_encrypted = True
+                document.virus_scanned = True
+                document.audit_trail = True
+                document.save()
+                form.save_m2m()  # Save tags
+                enqueue(document)
             return redirect('my_documents')
         else:
             document = Document(status='failed')
@@ -57,6 +67,40 @@ def upload_document(request):
         'search_form': SearchForm()
     })
 
+def _id_page(ids, page_number, scores=None):
+    """
+    One page of documents from an ordered list of ids. Only the ids of the
+    page are fetched. With ``scores`` the documents get a relevance score
+    relative to the best one.
+    """
+    paginator = Paginator(ids, 10)
+    try:
+        page = paginator.page(page_number)
+    except:
+        page = paginator.page(1)
+    found = Document.objects.select_related('owner').prefetch_related('tags', 'auto_keywords').in_bulk(list(page.object_list))
+    page.object_list = [found[document_id] for document_id in page.object_list if document_id in found]
+    if scores:
+        best = max(scores.values())
+        for document in page.object_list:
+            document.relevance_score = max(round(100 * scores[document.pk] / best), 0)
+    return page
+
+def _ranked_page(documents, query, page_number, candidates=None, engine=keyword, ranking=None):
+    """
+    Rank ``documents`` for ``query`` with a search engine (the keyword index
+    by default) and return one page of them, best match first.
+    ``candidates`` is handed to the engine to restrict the ranking (see
+    documents.search.ranking.top_k); it matters when filters leave few
+    documents. A ``ranking`` computed beforehand is used as is.
+    """
+    if ranking is None:
+        ranking = engine.search(query, candidates=candidates)
+    scores = dict(ranking)
+    allowed = set(documents.filter(pk__in=list(scores)).values_list('pk', flat=True))
+    ranked_ids = [document_id for document_id, _ in ranking if document_id in allowed]
+    return _id_page(ranked_ids, page_number, scores)
+
 @login_required
 def my_documents(request):
     documents = Document.objects.filter(owner=request.user)
@@ -66,28 +110,19 @@ def my_documents(request):
     category = request.GET.get('category', '')
     access_level = request.GET.get('access_level', '')
     
-    if search_query:
-        documents = documents.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(tags__name__icontains=search_query)
-        ).distinct()
     if category:
         documents = documents.filter(category=category)
     if access_level:
         documents = documents.filter(access_level=access_level)
     
-    # Handle empty results
-    if not documents.exists():
-        documents = None
-    
-    # Paginate results
-    paginator = Paginator(documents or [], 10)
-    page_number = request.GET.get('page', 1)
-    try:
-        documents_page = paginator.page(page_number)
-    except:
-        documents_page = paginator.page(1)
+    page_number = request.GET.get('page')
+    if search_query:
+        # Rank only this user's documents, ordered by relevance
+        candidates = np.fromiter(documents.values_list('pk', flat=True), dtype=np.int64)
+        documents_page = _ranked_page(documents, search_query, page_number, candidates)
+    else:
+        # Newest first, paged by (upload_date, id) cursors
+        documents_page = KeysetPaginator(documents, 10, ordering=('-upload_date', '-id')).page(page_number)
     
     return render(request, 'documents/my_documents.html', {
         'documents': documents_page,
@@ -105,32 +140,22 @@ def my_documents(request):
 @login_required
 def search_documents(request):
     form = SearchForm(request.GET or None)
-    documents = Document.objects.all().order_by('-upload_date')
+    documents = Document.objects.select_related('owner')
     query = None
-    search_type = 'keyword'
+    search_type = 'hybrid'
+    filtered = False
+    tagged = None
+    visibility = visibility_for(request.user)
 
     if form.is_valid():
         query = form.cleaned_data.get('query', '').strip()
-        search_type = form.cleaned_data.get('search_type', 'keyword')
+        search_type = form.cleaned_data.get('search_type') or 'hybrid'
         category = form.cleaned_data.get('category', '')
         access_level = form.cleaned_data.get('access_level', '')
         date_from = form.cleaned_data.get('date_from')
         date_to = form.cleaned_data.get('date_to')
         tags = form.cleaned_data.get('tags', [])
         
-        # Apply search query
-        if query:
-            if search_type in ['keyword', 'hybrid']:
-                documents = documents.filter(
-                    Q(title__icontains=query) |
-                    Q(description__icontains=query) |
-                    Q(tags__name__icontains=query)
-                ).distinct()
-            # Placeholder for semantic search (requires Elasticsearch)
-            if search_type in ['semantic', 'hybrid'] and 'django_elasticsearch_dsl' in settings.INSTALLED_APPS:
-                # Implement Elasticsearch query here
-                pass
-        
         # Apply filters
         if category:
             documents = documents.filter(category=category)
@@ -140,83 +165,80 @@ def search_documents(request):
             documents = documents.filter(upload_date__gte=date_from)
         if date_to:
             documents = documents.filter(upload_date__lte=date_to)
+        filtered = any([category, access_level, date_from, date_to])
+        # Tags are matched in the in-memory tag index instead of one join per tag
         if tags:
-            for tag in tags:
-                documents = documents.filter(tags__name=tag)
+            tagged = tag_index.document_ids(tags, form.cleaned_data.get('tag_mode') or 'and')
+        filters = [category, access_level, date_from, date_to, sorted(tags), form.cleaned_data.get('tag_mode')]
     
-    # Handle empty results
-    if not documents.exists():
-        documents = None
+    # Documents left by the filters, as ids, when there are filters at all
+    candidates = None
+    if filtered:
+        candidates = np.fromiter(documents.values_list('pk', flat=True), dtype=np.int64)
+        if tagged is not None:
+            candidates = np.intersect1d(candidates, tagged, assume_unique=True)
+    elif tagged is not None:
+        candidates = tagged
+    if candidates is not None:
+        candidates = visibility.filter(candidates)
     
-    # Paginate results
-    paginator = Paginator(documents or [], 10)
-    page_number = request.GET.get('page', 1)
-    try:
-        documents_page = paginator.page(page_number)
-    except:
-        documents_page = paginator.page(1)
+    page_number = request.GET.get('page')
+    if query:
+        engine = {'keyword': keyword, 'semantic': semantic}.get(search_type, hybrid)
+        # Repeated queries (and paging through one) reuse the ranking of
+        # anyone with the same access, filters and search type
+        ranking = result_cache.ranking(
+            f'search-{search_type}', query, filters, visibility,
+            lambda: engine.search(query, candidates=visibility if candidates is None else candidates),
+            analyzed=engine is keyword,
+        )
+        documents_page = _ranked_page(documents, query, page_number, ranking=ranking)
+    elif tagged is not None:
+        # Newest first; ids grow with upload dates
+        documents_page = _id_page(candidates[::-1].tolist(), page_number)
+    else:
+        documents = documents.filter(visible_q(request.user))
+        documents_page = KeysetPaginator(documents, 10, ordering=('-upload_date', '-id')).page(page_number)
+    
+    # Tags are only counted over documents the user may see: the ranking,
+    # the filtered documents, or else everything visible to them
+    if query:
+        facet_bitmap = bitmap_from_ids([document_id for document_id, _ in ranking])
+    elif candidates is not None:
+        facet_bitmap = bitmap_from_ids(candidates)
+    else:
+        facet_bitmap = visible_bitmap(visibility)
+    tag_facets = tag_index.facets(facet_bitmap)
     
     return render(request, 'documents/search_results.html', {
         'form': form,
         'documents': documents_page,
+        'tag_facets': tag_facets,
         'query': query if form.is_valid() else '',
-        'search_type': search_type if form.is_valid() else 'keyword'
+        'search_type': search_type if form.is_valid() else 'hybrid'
     })
 
 @login_required
 def view_document(request, document_id):
     document = get_object_or_404(Document, id=document_id)
-    if document.owner != request.user and not (
-        document.access_level == 'public' or
-        document.access_level == 'internal' or
-        (document.access_level == 'restricted' and request.user.has_perm('documents.can_view_restricted')) or
-        (document.access_level == 'private' and request.user.has_perm('documents.can_view_private'))
-    ):
+    if not can_view(request.user, document):
         return HttpResponseForbidden("You do not have permission to view this document.")
     
-    document.views += 1
-    document.save()
+    # Viewers fetch the rest of a file with further range requests; only
+    # count the request that starts at the beginning.
+    range_header = request.headers.get('Range', '')
+    if not range_header or range_header.startswith('bytes=0-'):
+        record_view(document)
     
-    fernet = Fernet(document.encryption_key)
-    with open(document.file.path, 'rb') as f:
-        encrypted_content = f.read()
-    decrypted_content = fernet.decrypt(encrypted_content)
-    
-    mime_type, _ = mimetypes.guess_type(document.file.name)
-    if not mime_type:
-        mime_type = 'application/octet-stream'
-    elif document.file.name.endswith('.csv'):
-        mime_type = 'text/csv'
-    
-    response = HttpResponse(decrypted_content, content_type=mime_type)
-    response['Content-Disposition'] = f'inline; filename="{document.title}"'
-    return response
+    return encrypted_file_response(request, document)
 
 @login_required
 def download_document(request, document_id):
     document = get_object_or_404(Document, id=document_id)
-    if document.owner != request.user and not (
-        document.access_level == 'public' or
-        document.access_level == 'internal' or
-        (document.access_level == 'restricted' and request.user.has_perm('documents.can_view_restricted')) or
-        (document.access_level == 'private' and request.user.has_perm('documents.can_view_private'))
-    ):
+    if not can_view(request.user, document):
         return HttpResponseForbidden("You do not have permission to download this document.")
     
-    fernet = Fernet(document.encryption_key)
-    with open(document.file.path, 'rb') as f:
-        encrypted_content = f.read()
-    decrypted_content = fernet.decrypt(encrypted_content)
-    
-    mime_type, _ = mimetypes.guess_type(document.file.name)
-    if not mime_type:
-        mime_type = 'application/octet-stream'
-    elif document.file.name.endswith('.csv'):
-        mime_type = 'text/csv'
-    
-    response = HttpResponse(decrypted_content, content_type=mime_type)
-    response['Content-Disposition'] = f'attachment; filename="{document.title}"'
-    return response
+    return encrypted_file_response(request, document, as_attachment=True)
 
 @login_required
 def delete_document(request, document_id):
@@ -225,7 +247,7 @@ def delete_document(request, document_id):
         return HttpResponseForbidden("You can only delete your own documents.")
     
     if request.method == 'POST':
-        document.file.delete()
+        # The stored file is released by the post_delete signal
         document.delete()
     return redirect('my_documents')
 
@@ -274,21 +296,12 @@ def approve_request(request, request_id):
     if request.method == 'POST':
         access_request.status = 'approved'
         access_request.save()
-        # Grant permission via group
-        group, _ = Group.objects.get_or_create(name=f"Access_{access_request.document.id}")
-        if access_request.document.access_level == 'restricted':
-            permission, _ = Permission.objects.get_or_create(
-                codename='can_view_restricted',
-                content_type=ContentType.objects.get_for_model(Document)
-            )
-            group.permissions.add(permission)
-        elif access_request.document.access_level == 'private':
-            permission, _ = Permission.objects.get_or_create(
-                codename='can_view_private',
-                content_type=ContentType.objects.get_for_model(Document)
-            )
-            group.permissions.add(permission)
-        access_request.requester.groups.add(group)
+        # Access to this one document only
+        DocumentGrant.objects.get_or_create(
+            document=access_request.document,
+            user=access_request.requester,
+            defaults={'granted_by': request.user}
+        )
         messages.success(request, "Access request approved.")
         return redirect('manage_requests')
     return redirect('manage_requests')
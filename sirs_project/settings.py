@@ -79,6 +79,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'sirs_project.wsgi.application'
+# Chat answers are streamed from async views; serve with an ASGI server, e.g.
+# gunicorn -k uvicorn.workers.UvicornWorker sirs_project.asgi
+ASGI_APPLICATION = 'sirs_project.asgi.application'
 
 
 # Database
@@ -137,6 +140,75 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'  # URL to access media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Directory for media files
 
+# Document encryption
+DOCUMENT_MASTER_KEY_FILE = os.environ.get('SIRS_MASTER_KEY_FILE', BASE_DIR / 'keys' / 'master.key')  # Wraps per-document keys
+DOCUMENT_KEY_CACHE_SIZE = 1024  # Unwrapped data keys kept in memory per process
+DOCUMENT_KEY_CACHE_TTL = 300  # Seconds an unwrapped data key stays cached
+# Compression applied before encryption, by file extension ('zstd', 'zlib' or 'none')
+DOCUMENT_COMPRESSION = {
+    'csv': 'zstd',
+    'txt': 'zstd',
+    'xls': 'zstd',
+    'doc': 'zstd',
+    'ppt': 'zstd',
+}
+# Processing steps run by the ingestion workers (manage.py run_ingestion_workers)
+DOCUMENT_INGESTION_STAGES = [
+    'documents.ingestion.verify_content',
+    'documents.extraction.extract_document_text',
+    'documents.search.indexer.queue_document',
+]
+DOCUMENT_EXTRACTION_MAX_CHARS = 5_000_000  # Extracted text kept per document
+# CPU-only semantic search (documents.search.semantic); snapshots are built
+# with manage.py build_semantic_index
+SEMANTIC_SEARCH = {
+    'BACKEND': 'auto',  # 'transformers', 'hashing', or 'auto' to fall back to hashing without PyTorch
+    'MODEL': 'sentence-transformers/all-MiniLM-L6-v2',
+    'INDEX_DIR': BASE_DIR / 'index' / 'semantic',
+    'DTYPE': 'float32',
+    'IVF_THRESHOLD': 50_000,
+    'IVF_PROBES': 16,
+}
+# Hybrid search fuses keyword and semantic rankings; semantic results that take
+# longer than the budget are dropped and the keyword ranking is served alone
+HYBRID_SEARCH = {
+    'BUDGET_MS': 150,
+    'RRF_K': 60,
+    'KEYWORD_WEIGHT': 1.0,
+    'SEMANTIC_WEIGHT': 1.0,
+    'WORKERS': 4,
+}
+
+# The chat model is served to all web workers by one process per host
+# (manage.py run_inference_server); see chat.inference
+CHAT_INFERENCE = {
+    'SOCKET': BASE_DIR / 'run' / 'inference.sock',
+    'MODEL': 'distilbert-base-uncased-finetuned-sst-2-english',  # A checkpoint fine-tuned for classification
+    'BACKEND': 'torch',  # 'int8' or 'onnx' once converted with manage.py convert_chat_model
+    'ARTIFACT_DIR': BASE_DIR / 'cache' / 'inference',
+    'TIMEOUT': 2.0,
+    'MAX_BATCH_SIZE': 32,  # Concurrent requests are classified in batches of up to
+    'MAX_WAIT_MS': 10,  # this many texts, waiting at most this long to fill one
+}
+# Models are loaded on first use and unloaded, least recently used first,
+# when a process holds more than BUDGET_MB of them (documents.model_registry)
+MODEL_REGISTRY = {
+    'BUDGET_MB': 2048,
+}
+# Document views are buffered per process and written every FLUSH_INTERVAL
+# seconds (documents.counters)
+DOCUMENT_VIEW_COUNTER = {
+    'FLUSH_INTERVAL': 5,
+    'BUCKET_SECONDS': 3600,
+    'RETENTION_DAYS': 30,
+}
+# Search and chat rankings shared by users with the same access; 'file'
+# shares them between the processes of one host (documents.search.cache)
+SEARCH_RESULT_CACHE = {
+    'BACKEND': 'memory',
+    'MAX_SIZE_MB': 64,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 